@@ -1,21 +1,47 @@
 import os
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from docx import Document
 from tqdm import tqdm
 
+from adaptive_limiter import get_default_limiter
+from endpoint_pool import get_default_pool
+from http_client import get_default_client
+from llm_cache import get_default_cache
+from metrics import get_default_metrics
+from outline_reader import read_outline
+from outline_tree import parse_word_count
+from ollama_client import generate, response_stats
+from prompt_budget import build_section_prompt, estimate_tokens, format_report
+from req_summary import RequirementSummarizer, summary_digest
+from retrieval import RequirementIndex
+from run_journal import RunJournal, section_key
+from stream_docx_writer import OrderedSections, StreamingDocxWriter
+
+FAILED_ANSWER = "（无法生成内容，请检查 Ollama 配置）"
+
+# 提示词布局：
+#   title_first   - 标题在前、上下文在后（原有布局）
+#   shared_prefix - 所有章节共用的说明和文档级上下文在前、本节内容在后，便于 Ollama 复用前缀的 KV 缓存
+# 前缀复用完全依赖 Ollama 对相同 prompt 开头的自动 KV 缓存，不使用 /api/generate 的 context 字段：
+# context 用于把上一轮对话接续下去，各章节是互相独立的请求，不能共用同一个 context
+PROMPT_LAYOUTS = ("title_first", "shared_prefix")
+# 没有需求摘要时，共用前缀改为携带需求原文开头的段落（通常是项目概况），最多这么多 token
+SHARED_OVERVIEW_TOKENS = 1024
+SHARED_INSTRUCTIONS = (
+    "你是投标文件撰写助手。请根据招标需求，用正式、严谨的中文撰写投标文件中指定章节的正文，"
+    "紧扣需求中的数字、日期和硬性要求，不要复述标题，不要编造需求中没有的承诺。"
+)
+
 
 def read_outline_from_docx(docx_path):
     """
     从 docx 文件中读取目录大纲
+    直接流式解析 document.xml，按样式ID/大纲级别识别标题，无需构建完整的文档对象
     返回：包含章节标题及其级别的列表
     """
-    document = Document(docx_path)
-    outline = []
-    for paragraph in document.paragraphs:
-        if paragraph.style.name.startswith("Heading"):  # 检测标题样式
-            level = int(paragraph.style.name.split(" ")[1])  # 获取标题级别
-            outline.append((level, paragraph.text.strip()))
-    return outline
+    return read_outline(docx_path)
 
 
 def read_and_analyze_requirements(req_docx_path):
@@ -32,78 +58,287 @@ def read_and_analyze_requirements(req_docx_path):
     return requirements
 
 
-def ask_ollama(question, model="llama2"):
+def ask_ollama(question, model="llama2", options=None, keep_alive=None, stats=None):
     """
     调用本地 Ollama 接口回答问题
     参数:
         question: 提问内容
         model: Ollama 使用的模型名称
+        options: 生成参数，如 num_ctx、num_predict
+        keep_alive: 指定时改用流式 /api/generate，并让模型在空闲后保持加载该时长（如 "30m"）
+        stats: 可选的字典，写入本次请求的 ttft、tokens_per_sec、prefill/decode 耗时等统计（命中缓存时不写入）
     返回:
         Ollama 的回答文本
     """
-    url = "http://localhost:11434/api/completion"  # Ollama 本地 API 地址
     headers = {"Content-Type": "application/json"}
     payload = {
         "model": model,
         "prompt": question,
     }
+    if options:
+        payload["options"] = options
 
-    try:
-        response = requests.post(url, json=payload, headers=headers)
+    def post(base_url, usage):
+        url = f"{base_url}/api/completion"  # Ollama API 地址
+        start = time.perf_counter()
+        response = get_default_client().post(url, json=payload, headers=headers)
         response.raise_for_status()  # 检查请求是否成功
         result = response.json()
-        return result.get("completion", "（Ollama 未返回内容）")
-    except Exception as e:
-        print(f"调用 Ollama 接口失败：{e}")
-        return "（无法生成内容，请检查 Ollama 配置）"
+        get_default_metrics().record_llm(result)
+        call_stats = response_stats(result, model, time.perf_counter() - start)
+        if stats is not None:
+            stats.update(call_stats)
+        usage["decode_time"] = call_stats["decode_time"]
+        return result.get("completion")
+
+    def send(usage):
+        if keep_alive is not None:
+            call_stats = {} if stats is None else stats
+            answer = generate(question, model, options=options, stats=call_stats, keep_alive=keep_alive)
+            usage["decode_time"] = call_stats.get("decode_time")
+            return answer
+        # 从地址池选择负载最低的主机，失败时自动切换到其他主机
+        return get_default_pool().call(lambda base_url: post(base_url, usage))
+
+    def request():
+        try:
+            # 自适应限流：根据排队延迟和过载错误动态调整同时发往 Ollama 的请求数
+            with get_default_limiter().slot() as usage:
+                return send(usage)
+        except Exception as e:
+            print(f"调用 Ollama 接口失败：{e}")
+            return None
+
+    # 命中缓存时不再请求模型，失败结果不写入缓存
+    answer = get_default_cache().cached(model, question, request, params=options)
+    if answer is None:
+        return FAILED_ANSWER
+    return answer
+
+
+def leading_paragraphs(paragraphs, max_tokens):
+    """按原文顺序取开头的段落，直到 token 上限"""
+    kept = []
+    used = 0
+    for paragraph in paragraphs:
+        used += estimate_tokens(paragraph) + 1  # 换行分隔符
+        if used > max_tokens:
+            break
+        kept.append(paragraph)
+    return kept
+
+
+def build_shared_prefix(digest=None, overview=None):
+    """
+    构建所有章节共用的提示词前缀：固定说明 + 文档级上下文
+    参数:
+        digest: 需求文件摘要，优先使用
+        overview: 没有摘要时使用的需求原文段落（见 leading_paragraphs）
+    """
+    prefix = SHARED_INSTRUCTIONS
+    if digest:
+        prefix += f"\n\n需求文件摘要：\n{digest}"
+    elif overview:
+        prefix += "\n\n需求文件概况：\n" + "\n".join(overview)
+    return prefix
+
+
+def build_section_question(title, references, model="llama2", max_context_tokens=None, prefix=None, verbose=True):
+    """
+    构建单个标题的提问，需求段落按优先级装入，不超过模型的上下文预算
+    参数:
+        prefix: 共用前缀，给定时采用 shared_prefix 布局，本节的需求原文和标题放在最后
+        verbose: 为 False 时不打印被舍弃段落的报告（只为计算日志哈希构建提问时使用）
+    返回：(question, options)
+    """
+    _, word_count = parse_word_count(title)
+    if prefix is None:
+        render = lambda context: f"根据以下需求内容，回答与标题 '{title}' 相关的内容：\n{context}"
+    else:
+        render = lambda context: f"{prefix}\n\n与本节相关的需求原文：\n{context}\n\n请撰写章节“{title}”的正文。"
+    question, options, report = build_section_prompt(
+        render,
+        references,
+        model,
+        word_count,
+        max_context_tokens,
+    )
+    if verbose and report["dropped"]:
+        print(format_report(title, report))
+    return question, options
+
+
+def generate_section(level, title, question, model="llama2", options=None, keep_alive=None, timings=None):
+    """
+    为单个标题生成内容
+    参数:
+        question: 已包含相关需求内容的提问
+        timings: 可选的列表，用于收集每次调用的 prefill/decode 耗时
+    返回：(level, title, answer)
+    """
+    stats = {}
+    start = time.perf_counter()
+    # 调用 Ollama 获取回答
+    answer = ask_ollama(question, model, options, keep_alive=keep_alive, stats=stats)
+    # 每个章节的首字延迟和生成速度写入性能报告的 sections
+    get_default_metrics().record_section(
+        title, time.perf_counter() - start, level=level,
+        prompt_tokens=stats.get("prompt_tokens"), completion_tokens=stats.get("completion_tokens"),
+        ttft=stats.get("ttft"), tokens_per_sec=stats.get("tokens_per_sec"),
+    )
+    if stats and timings is not None:
+        timings.append(stats)
+    if not answer.strip():  # 如果 Ollama 没有回答内容，留空等待人工填写
+        answer = "（无匹配内容，请后续手动补充）"
+    return level, title, answer
 
 
-def match_and_fill_outline_with_ollama(outline, requirements, model="llama2"):
+def match_and_fill_outline_with_ollama(
+    outline, requirements, model="llama2", max_workers=1, top_k=5, max_context_tokens=2000, journal=None, digest=None,
+    prompt_layout="title_first", keep_alive=None, on_section=None,
+):
     """
     根据目录大纲和需求内容，调用 Ollama 自动生成回答
-    返回：填充后的目录内容
-    """
-    content = []
-    for level, title in tqdm(outline, desc="自动生成目录内容", unit="标题"):
-        # 将需求内容合并为上下文
-        context = "\n".join(requirements)
-        question = f"根据以下需求内容，回答与标题 '{title}' 相关的内容：\n{context}"
-        
-        # 调用 Ollama 获取回答
-        answer = ask_ollama(question, model)
-        if not answer.strip():  # 如果 Ollama 没有回答内容，留空等待人工填写
-            answer = "（无匹配内容，请后续手动补充）"
-
-        content.append((level, title, answer))
+    参数:
+        max_workers: 同时发往 Ollama 的最大请求数，1 表示逐个顺序生成
+        top_k: 每个标题携带的最相关需求段落数，None 表示携带全部需求内容
+        max_context_tokens: 每个标题上下文的 token 上限，None 表示只受模型上下文预算限制
+        journal: 可选的 RunJournal，已完成的章节直接复用，新完成的章节立即记录
+        digest: 可选的需求文件摘要，作为优先级最高的上下文放在检索到的原文段落之前
+        prompt_layout: 提示词布局，见 PROMPT_LAYOUTS；shared_prefix 布局下摘要（没有摘要时为需求原文的开头部分）放入共用前缀
+        keep_alive: 模型保持加载的时长，指定后会统计每次调用的 prefill/decode 耗时
+        on_section: 可选的回调 on_section(pos, level, title, answer)，每个章节完成时立即调用
+    返回：填充后的目录内容（与大纲顺序一致）；给定 on_section 时返回 None
+    """
+    if prompt_layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"未知的提示词布局：{prompt_layout}，可选值为 {PROMPT_LAYOUTS}")
+    prefix = None
+    overview = []
+    if prompt_layout == "shared_prefix":
+        overview = [] if digest else leading_paragraphs(requirements, SHARED_OVERVIEW_TOKENS)
+        prefix = build_shared_prefix(digest, overview)
+    overview = set(overview)
+    timings = [] if keep_alive is not None else None
+
+    # 只构建一次索引，每个标题只携带检索到的相关段落；top_k 为 None 时按原文顺序装入全部需求
+    with get_default_metrics().stage("build_index"):
+        index = RequirementIndex(requirements) if top_k is not None else None
+
+    def section_prompt(pos, verbose=True):
+        # 提问在用到时才构建，不为整份大纲预先保存全部提问
+        title = outline[pos][1]
+        references = requirements if index is None else index.top_paragraphs(title, top_k)
+        # 已在共用前缀中的段落不再重复携带
+        references = [paragraph for paragraph in references if paragraph not in overview]
+        if digest and prefix is None:
+            references = [digest] + references
+        return build_section_question(title, references, model, max_context_tokens, prefix, verbose)
+
+    def section_key_at(pos):
+        return section_key(*outline[pos], model, *section_prompt(pos, verbose=False))
+
+    # 给定 on_section 时结果直接交给回调，不在内存中保留全部章节的回答
+    content = [None] * len(outline) if on_section is None else None
+
+    def deliver(pos, result):
+        if on_section is not None:
+            on_section(pos, *result)
+        else:
+            content[pos] = result
+
+    keys = None
+    pending = list(range(len(outline)))
+    if journal is not None:
+        # 日志按内容哈希对比，只保存各章节的哈希
+        with get_default_metrics().stage("build_prompts"):
+            keys = [section_key_at(pos) for pos in range(len(outline))]
+        reused, pending, removed = journal.diff(keys)
+        for pos in reused:
+            level, title = outline[pos]
+            deliver(pos, (level, title, journal.lookup(keys[pos])))
+        if reused:
+            print(f"从运行日志复用 {len(reused)} 个章节，需生成 {len(pending)} 个，{removed} 个旧章节已不在大纲中")
+
+    def generate(pos):
+        question, options = section_prompt(pos)
+        return generate_section(*outline[pos], question, model, options, keep_alive, timings)
+
+    def finish(pos, result):
+        if journal is not None and result[2] != FAILED_ANSWER:  # 失败的章节下次运行时重试
+            journal.record(pos, keys[pos], *result)
+        deliver(pos, result)
+
+    if max_workers <= 1:
+        for pos in tqdm(pending, desc="自动生成目录内容", unit="标题"):
+            finish(pos, generate(pos))
+    else:
+        # 并发生成：按大纲位置回填结果，保证输出顺序不变
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(generate, pos): pos for pos in pending}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="自动生成目录内容", unit="标题"):
+                # 处理完即丢弃 future，已完成章节的回答不在这里累积
+                pos = futures.pop(future)
+                level, title = outline[pos]
+                try:
+                    finish(pos, future.result())
+                except Exception as e:  # 单个章节失败不影响其他章节
+                    print(f"生成章节 '{title}' 失败：{e}")
+                    finish(pos, (level, title, FAILED_ANSWER))
+
+    if journal is not None:
+        # 全部章节处理完后，日志中只保留当前大纲的章节
+        journal.compact(keys)
+    if timings:
+        print_timing_summary(timings)
     return content
 
 
-def write_to_new_docx(output_path, content):
+def print_timing_summary(timings):
+    """汇总各次调用的 prompt 处理（prefill）与解码（decode）耗时"""
+    prefill = sum(t["prefill_time"] or 0 for t in timings)
+    decode = sum(t["decode_time"] or 0 for t in timings)
+    prompt_tokens = sum(t["prompt_tokens"] or 0 for t in timings)
+    print(
+        f"共 {len(timings)} 次调用：prefill {prefill:.1f}s（平均 {prefill / len(timings):.2f}s），"
+        f"decode {decode:.1f}s（平均 {decode / len(timings):.2f}s），实际处理的 prompt tokens {prompt_tokens}"
+    )
+    metrics = get_default_limiter().metrics()
+    print(f"自适应并发上限 {metrics['limit']}，过载次数 {metrics['overloads']}，服务端平均排队 {metrics['queue_time_ewma']:.2f}s")
+
+
+def summarize_requirements(req_docx_path, model="llama2", max_workers=1):
     """
-    将生成的内容写入新的 docx 文件
+    对需求文件做一次分层摘要（按文件内容哈希缓存），返回文档级摘要文本
     """
-    document = Document()
-    for level, title, answer in tqdm(content, desc="写入文档", unit="章节"):
-        # 添加标题
-        document.add_heading(title, level=level)
-        # 添加内容
-        document.add_paragraph(answer)
-    # 确保输出目录存在
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    # 保存文档
-    document.save(output_path)
-    print(f"文档已保存到：{output_path}")
+    def summarize(prompt):
+        answer = ask_ollama(prompt, model)
+        return None if answer == FAILED_ANSWER else answer
+
+    summarizer = RequirementSummarizer(summarize, model=model, max_workers=max_workers)
+    return summary_digest(summarizer.build(req_docx_path))
 
 
-def main(docx_path, req_docx_path, output_path, model="llama2"):
+def main(
+    docx_path, req_docx_path, output_path, model="llama2", max_workers=1, resume=True, summarize=False,
+    prompt_layout="title_first", keep_alive=None, template=None,
+):
     """
     主程序
+    参数:
+        resume: 为 True 时使用输出文件旁的运行日志，跳过上次已完成且未变化的章节
+        summarize: 为 True 时先对需求文件做分层摘要，各章节只携带摘要和少量相关原文段落
+        prompt_layout: 提示词布局，shared_prefix 可复用 Ollama 的前缀缓存
+        keep_alive: 模型保持加载的时长，如 "30m"
+        template: 提供样式的模板 docx，例如大纲文件本身；为 None 时使用 python-docx 的默认模板
     """
     if not os.path.exists(docx_path):
         print(f"目录文件路径无效：{docx_path}")
         return
 
-    outline = read_outline_from_docx(docx_path)
+    metrics = get_default_metrics()
+    metrics.reset()
+    with metrics.stage("read_outline"):
+        outline = read_outline_from_docx(docx_path)
     if not outline:
         print("未在文档中检测到目录大纲，请检查文件内容！")
         return
@@ -112,16 +347,32 @@ def main(docx_path, req_docx_path, output_path, model="llama2"):
         print(f"需求文件路径无效：{req_docx_path}")
         return
 
-    requirements = read_and_analyze_requirements(req_docx_path)
+    with metrics.stage("read_requirements"):
+        requirements = read_and_analyze_requirements(req_docx_path)
     if not requirements:
         print("需求文件为空或未能提取有效内容，请检查文件！")
         return
 
-    print("\n正在根据需求文件生成内容，请稍候...\n")
-    auto_filled_content = match_and_fill_outline_with_ollama(outline, requirements, model)
+    journal = RunJournal(output_path + ".journal.jsonl") if resume else None
+
+    digest = None
+    if summarize:
+        print("\n正在生成需求文件摘要，请稍候...\n")
+        with metrics.stage("summarize"):
+            digest = summarize_requirements(req_docx_path, model, max_workers)
 
-    print("\n正在写入文档，请稍候...\n")
-    write_to_new_docx(output_path, auto_filled_content)
+    print("\n正在根据需求文件生成内容，请稍候...\n")
+    # 边生成边写入：章节按大纲顺序一完成就写进文档，不等全部生成结束
+    with metrics.stage("generate_and_write"), StreamingDocxWriter(output_path, template) as writer:
+        match_and_fill_outline_with_ollama(
+            outline, requirements, model, max_workers=max_workers, journal=journal,
+            top_k=3 if digest else 5, digest=digest, prompt_layout=prompt_layout, keep_alive=keep_alive,
+            on_section=OrderedSections(writer).put,
+        )
+    print(f"文档已保存到：{output_path}")
+    print(f"LLM 缓存统计：{get_default_cache().stats()}")
+    # 各阶段耗时、token 数、缓存命中和重试次数，供跨版本对比或 Prometheus 采集
+    print(f"性能报告：{'，'.join(metrics.write(output_path))}")
 
 
 if __name__ == "__main__":
@@ -132,6 +383,11 @@ if __name__ == "__main__":
 
     # Ollama 使用的模型名称
     ollama_model = "llama3.2"  # 可根据本地模型调整，例如 "llama2" 或其他模型
+    # 同时发往 Ollama 的请求数，需与服务端 OLLAMA_NUM_PARALLEL 相匹配
+    max_workers = 4
 
-    # 运行主程序
-    main(docx_path, req_docx_path, output_path, model=ollama_model)
+    # 运行主程序：共用前缀布局 + 模型常驻 30 分钟，章节之间复用前缀缓存
+    main(
+        docx_path, req_docx_path, output_path, model=ollama_model, max_workers=max_workers,
+        prompt_layout="shared_prefix", keep_alive="30m", template=docx_path,
+    )
@@ -5,6 +5,12 @@ from docx.shared import Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.style import WD_STYLE_TYPE
 
+from adaptive_limiter import get_default_limiter
+from endpoint_pool import get_default_pool
+from http_client import get_default_client
+from llm_cache import get_default_cache
+from metrics import get_default_metrics
+
 def ensure_style_exists(doc, style_name, style_type=WD_STYLE_TYPE.PARAGRAPH, left_indent=Inches(0.5)):
     if style_name not in doc.styles:
         style = doc.styles.add_style(style_name, style_type)
@@ -14,7 +20,6 @@ def ensure_style_exists(doc, style_name, style_type=WD_STYLE_TYPE.PARAGRAPH, lef
 
 def answer_question(question):
     # 调用Ollama来生成回答
-    url = "http://localhost:11434/api/completion"  # 假设 Ollama 运行在本地
     headers = {"Content-Type": "application/json"}
     payload = {
         "model": "llama3.2",  # 假设你使用的是模型名称
@@ -22,14 +27,27 @@ def answer_question(question):
         "max_tokens": 150
     }
     
-    try:
-        response = requests.post(url, json=payload, headers=headers)
+    def post(base_url, usage):
+        url = f"{base_url}/api/completion"  # 地址池中的 Ollama 主机
+        response = get_default_client().post(url, json=payload, headers=headers)
         response.raise_for_status()  # 如果失败会抛出异常
         result = response.json()
+        get_default_metrics().record_llm(result)
+        usage["decode_time"] = result["eval_duration"] / 1e9 if result.get("eval_duration") else None
         return result.get('completion', '无回答')
-    except requests.exceptions.RequestException as e:
-        print(f"请求 Ollama 时出错: {e}")
-        return "无法获得回答"
+
+    def request():
+        try:
+            with get_default_limiter().slot() as usage:
+                return get_default_pool().call(lambda base_url: post(base_url, usage))
+        except requests.exceptions.RequestException as e:
+            print(f"请求 Ollama 时出错: {e}")
+            return None
+
+    answer = get_default_cache().cached(
+        payload["model"], question, request, params={"max_tokens": payload["max_tokens"]}
+    )
+    return answer if answer is not None else "无法获得回答"
 
 def process_document(doc):
     indent_style = ensure_style_exists(doc, '正文缩进')
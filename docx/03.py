@@ -1,25 +1,41 @@
-import requests
-import json
 import gradio as gr
 
+from ollama_client import stream_generate
+from serving import ChatServer, ServerBusy
+
+MODEL = "llama3.2"
+
+# 所有用户的请求经同一个服务层排队、去重后再发往 Ollama；
+# Ollama 没有批量生成接口，不传 batch_generate，请求到达即流式发出，由 Ollama 的并行槽位在服务端合批
+server = ChatServer(lambda prompt: stream_generate(prompt, model=MODEL), model=MODEL)
+
+
 def generate_chat_response(prompt):
-    url = "http://localhost:11434/api/generate"
-    headers = {"Content-Type": "application/json"}
-    data = {
-        "model": "llama3.2",
-        "prompt": prompt
-    }
-
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-
-    if response.status_code == 200:
-        response_text = response.text
-        data = json.loads(response_text)
-        final_response = data.get("completion", "无回答")
-        return final_response
-    else:
-        print("Error:", response.status_code, response.text)
-        return "无法获得回答"
+    """流式生成回答，每收到一段文本就把已生成的内容推送给界面"""
+    try:
+        flight = server.submit(prompt)
+    except ServerBusy:
+        yield "服务繁忙，请稍后再试"
+        return
+
+    answer = ""
+    try:
+        for token in flight:
+            answer += token
+            yield answer
+    except Exception as e:
+        print("Error:", e)
+        yield answer or "无法获得回答"
+        return
+
+    if not answer:
+        yield "无回答"
+    metrics = server.metrics()
+    p95 = f"{metrics['p95']:.2f}s" if "p95" in metrics else "-"
+    print(
+        f"请求 {metrics['requests']}，缓存命中 {metrics['cache_hits']}，去重 {metrics['deduplicated']}，"
+        f"拒绝 {metrics['rejected']}，排队 {metrics['queue_depth']}，p95 {p95}"
+    )
 
 demo = gr.Interface(
     fn=generate_chat_response,
@@ -27,5 +43,6 @@ demo = gr.Interface(
     outputs=gr.Textbox(lines=2, placeholder="回答")
 )
 
+# 与服务层的队列上限配合，Gradio 自身也限制排队和并发处理的请求数
+demo.queue(max_size=128, default_concurrency_limit=32)
 demo.launch(share=True)
-
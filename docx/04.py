@@ -2,19 +2,16 @@ import os
 import requests
 from docx import Document
 
+from outline_reader import read_outline
+
  
 def read_outline_from_docx(docx_path):
     """
     从 docx 文件中读取目录大纲
+    直接流式解析 document.xml，按样式ID/大纲级别识别标题，无需构建完整的文档对象
     返回：包含章节标题及其级别的列表
     """
-    document = Document(docx_path)
-    outline = []
-    for paragraph in document.paragraphs:
-        if paragraph.style.name.startswith("Heading"):  # 检测标题样式
-            level = int(paragraph.style.name.split(" ")[1])  # 获取标题级别
-            outline.append((level, paragraph.text.strip())) 
-    return outline
+    return read_outline(docx_path)
 
 def read_and_analyze_requirements(req_docx_path):
     """
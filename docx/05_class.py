@@ -2,18 +2,18 @@
 # |                   DocProcessor              |
 # +---------------------------------------------+
 # | - doc_path: str                              |
-# | - outline: dict                              |
+# | - outline: OutlineNode                       |
 # | - references: dict[str, DocReference]       |
-# ｜ - document: Document（）                       |
+# | - template: str | None                       |
 # | - api_caller: ApiCaller                      |
 # +---------------------------------------------+
 # | + load_document(): None                      |
-# | + extract_outline(): dict                    |
+# | + extract_outline(): OutlineNode             |
 # | + fill_content(): None                        |
-# | + save_document(): None                      |
+# | + save_document(file_path: str): None        |
 # | + process_outline(): None                    |
 # | + add_reference(name: str, reference: DocReference): None |
-# | + generate_content(level: int, text: str): str |
+# | + generate_content(word_count: int, text: str): str |
 # | + adjust_content(section: str, feedback: str): None |
 # +---------------------------------------------+
 
@@ -24,7 +24,8 @@
 # | - api_key: str                               |
 # | - endpoint: str                              |
 # +---------------------------------------------+
-# | + call_api(prompt: str) -> str               |
+# | + call_api(prompt: str, options: dict) -> str |
+# | + call_batch(prompts: list[str], options: dict) -> list[str] |
 # +---------------------------------------------+
 
 # +---------------------------------------------+
@@ -42,16 +43,17 @@
 # 属性：
 
 # doc_path：文档路径。
-# outline：存储文档大纲的字典，每个级别对应其子级内容。
+# outline：文档大纲树（OutlineNode），节点带父节点/兄弟节点链接，层级不限。
 # references：字典，用于存储参考文档（如docB、docC等）。
 # api_caller：一个ApiCaller实例，用于和AI接口交互。
+# template：保存文档时提供样式的模板 docx，为 None 时使用 python-docx 的默认模板。
 # 主要方法：
 
 # load_document()：加载长文档并提取大纲。
-# extract_outline()：提取文档大纲为字典。
+# extract_outline()：单次遍历提取文档大纲为树。
 # process_outline()：按层级逐级处理大纲内容，生成并填充文档内容。
 # add_reference(name, reference)：增加参考文档对象。
-# generate_content(level, text)：调用API生成内容，自动处理字数要求。
+# generate_content(word_count, text)：调用API生成内容，自动处理字数要求。
 # adjust_content(section, feedback)：接收反馈并修改特定部分内容。
 
 
@@ -60,12 +62,14 @@
 
 # 属性：
 
-# api_type：API类型（如"OpenAI"、"Ollama"等）。
+# api_type：API类型（如"OpenAI"、"Ollama"、"HuggingFace"等，"HuggingFace" 为进程内的本地批量推理）。
 # api_key：API密钥。
 # endpoint：API端点。
 # 方法：
 
-# call_api(prompt)：调用指定API，发送prompt并返回生成结果。
+# call_api(prompt, options)：调用指定API，发送prompt并返回生成结果。
+# call_batch(prompts, options)：批量调用，同一层级互不依赖的prompt一次性提交给后端（批量请求或并发请求）。
+# options 为 Ollama 风格的生成参数（num_predict、num_ctx），由 prompt_budget.generation_options 按字数要求给出。
 
 
 # 3-DocReference
@@ -79,121 +83,342 @@
 # extract_content(outline_section)：从参考文档中提取特定大纲部分的内容。
 
 
-from docx import Document
+from concurrent.futures import ThreadPoolExecutor
+import math
 import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+
+from adaptive_limiter import get_default_limiter
+from endpoint_pool import EndpointPool
+from http_client import get_default_client
+from llm_cache import get_default_cache
+from metrics import get_default_metrics
+from outline_reader import read_outline
+from outline_tree import OutlineNode, build_outline_tree, iter_levels, parse_word_count, walk
+from prompt_budget import DEFAULT_WORD_COUNT, generation_options
+from stream_docx_writer import StreamingDocxWriter
+
+# huggingface/ 下的本地推理模块不是包，按目录加入导入路径
+HUGGINGFACE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "huggingface")
+if HUGGINGFACE_DIR not in sys.path:
+    sys.path.insert(0, HUGGINGFACE_DIR)
+# 字数过多的标题最多连续拆分的次数，避免模型给出的子标题仍然过长时无限拆分下去
+MAX_SPLIT_DEPTH = 3
 
 
 # 加载大纲并处理
 class DocProcessor:
-    def __init__(self, doc_path, api_caller):
+    def __init__(self, doc_path, api_caller, template=None):
         self.doc_path = doc_path
         self.api_caller = api_caller
-        self.outline = {}
-        self.document=Document()
+        self.outline = build_outline_tree([])
+        self.template = template
         self.references = {}
+        self.metrics = get_default_metrics()
+        self._split_depth = {}  # 由 generate_sub_outline 生成的节点 -> 距原始标题的拆分次数
 
     def load_document(self):
-        """加载文档"""
-        doc = Document(self.doc_path)
-        self.extract_outline(doc)
-
-    def extract_outline(self, doc):
-        """提取文档大纲构建一个嵌套字典结构"""
-        self.outline = {"title": "Document Title", "content": "", "subsections": {}}
-        current_section = None
-
-        for paragraph in doc.paragraphs:
-            if paragraph.style.name.startswith('Heading'):
-                level = int(paragraph.style.name[-1])
-                title = paragraph.text.strip()
-
-                if level == 1:  # 一级标题
-                    current_section = {"content": "", "subsections": {}}
-                    self.outline['subsections'][title] = current_section
-                elif level == 2 and current_section:  # 二级标题
-                    current_section['subsections'][title] = {"content": "", "subsections": {}}
-                elif level == 3 and current_section:  # 三级标题
-                    current_section['subsections'][title] = {"content": "", "subsections": {}}
-        print(self.outline)
-
-    def fill_content(self, section, level=1):
-        """填充大纲内容，递归调用AI生成内容"""
-        # 创建内容段落
-        section_title = section.get('title', 'Untitled Section')
-        self.document.add_heading(section_title, level)
-
-        # 调用API生成内容
-        section['content'] = self.api_caller.call_api(f"请生成{level}级标题的内容：{section_title}")
-        self.document.add_paragraph(section['content'])
-
-        # 递归处理子级
-        for subsection in section['subsections'].values():
-            self.fill_content(subsection, level + 1)
+        """加载文档，直接从 document.xml 流式读取标题"""
+        with self.metrics.stage("load_document"):
+            self.extract_outline(read_outline(self.doc_path))
+
+    def extract_outline(self, headings):
+        """根据 (level, title) 列表单次遍历构建大纲树，层级不限"""
+        self.outline = build_outline_tree(headings)
+        print(f"共提取 {sum(1 for _ in walk(self.outline))} 个标题")
+
+    def fill_content(self, section=None):
+        """填充大纲内容：同一层级的标题一次性批量提交给AI，内容保存在大纲节点上，由 save_document 写出"""
+        root = section if section is not None else self.outline
+        for nodes in iter_levels(root):
+            prompts = [f"请生成{node.level}级标题的内容：{node.title}" for node in nodes]
+            self._generate_level(nodes, prompts)
+
+    def _level_options(self, nodes):
+        """一层标题共用一次批量请求，生成长度按其中字数要求最多的标题估算"""
+        word_count = max((node.word_count or DEFAULT_WORD_COUNT for node in nodes), default=DEFAULT_WORD_COUNT)
+        return generation_options(self.api_caller.model, word_count)
+
+    def _generate_level(self, nodes, prompts):
+        """批量生成一层标题的内容；各章节记录的耗时是所在批次的总耗时"""
+        start = time.perf_counter()
+        with self.metrics.stage("generate_level"):
+            results = self.api_caller.call_batch(prompts, self._level_options(nodes))
+        seconds = time.perf_counter() - start
+        for node, content in zip(nodes, results):
+            node.content = content
+            self.metrics.record_section(node.title, seconds, level=node.level, batch_size=len(nodes))
 
     def save_document(self, file_path):
-        """保存填充后的文档"""
-        self.document.save(file_path)
+        """按大纲顺序把标题和内容流式写入文档，不在内存中构建整篇 docx"""
+        with self.metrics.stage("save_document"), StreamingDocxWriter(file_path, self.template) as writer:
+            for node in walk(self.outline):
+                # Word 内置标题样式只到 9 级，更深的标题按 9 级写入
+                writer.add_heading(node.title, min(node.level, 9))
+                writer.add_paragraph(node.content or "")
         print(f"文档已保存到 {file_path}")
+        print(f"性能报告：{'，'.join(self.metrics.write(file_path))}")
 
-    def process_outline(self, outline=None, level=1):
-        """递归处理大纲，生成内容"""
+    def process_outline(self, outline=None):
+        """按层级处理大纲，同一层级的内容一次性批量生成"""
         if outline is None:
             outline = self.outline
 
-        for section, sub_sections in outline.items():
-            # 检查字数要求
-            if "(" in section:
-                section_title, word_count = section.split("(")
-                word_count = int(word_count.strip(")"))
-                if word_count > 2000:
-                    # 调用AI生成子目录
-                    sub_sections = self.generate_sub_outline(section_title)
-            
-            # 调用API生成内容
-            content = self.generate_content(level, section)
-            print(f"填充内容：{content}")
-            
-            # 递归处理子级大纲
-            if sub_sections:
-                self.process_outline(sub_sections, level + 1)
-
-    def _add_to_outline(self, outline, level, content):
-        """递归存储大纲层级内容"""
-        # 实现逻辑：递归生成嵌套字典
-        pass
+        for nodes in iter_levels(outline):
+            for node in nodes:
+                # 检查字数要求
+                if node.word_count and node.word_count > 2000 and node.first_child is None:
+                    # 调用AI生成子目录，新子节点会在下一层被处理
+                    with self.metrics.stage("generate_sub_outline"):
+                        self.generate_sub_outline(node)
+
+            # 调用API批量生成本层级内容
+            prompts = [self.build_prompt(node.word_count or DEFAULT_WORD_COUNT, node.title) for node in nodes]
+            self._generate_level(nodes, prompts)
+            for node in nodes:
+                print(f"填充内容：{node.content}")
 
     def add_reference(self, name, reference):
         """增加参考文档对象，将一个外部文档引用添加到当前文档中"""
         self.references[name] = reference
 
     #  生成大纲级别的内容
-    def generate_content(self, level, text):
-        """根据输入的文本生成对应级别的内容，调用 API 生成内容"""
-        # 根据字数要求生成内容
-        prompt = f"请根据以下内容生成约{level}字：\n{text}"
-        content = self.api_caller.call_api(prompt)
+    def generate_content(self, word_count, text):
+        """根据输入的文本生成约 word_count 字的内容，调用 API 生成内容"""
+        options = generation_options(self.api_caller.model, word_count)
+        content = self.api_caller.call_api(self.build_prompt(word_count, text), options)
         return content
 
+    def build_prompt(self, word_count, text):
+        """根据字数要求构建生成内容的 prompt"""
+        return f"请根据以下内容生成约{word_count}字：\n{text}"
+
     # 拆分大纲并处理长内容
+    def generate_sub_outline(self, node, words_per_section=2000, max_depth=MAX_SPLIT_DEPTH):
+        """
+        调用AI为字数过多的标题拟定下一级子标题，子标题平分父标题的字数要求
+        模型给出的有效子标题少于两个（或只是重复父标题），或已连续拆分 max_depth 次时不再拆分
+        返回：是否添加了子标题
+        """
+        depth = self._split_depth.get(node, 0)
+        if depth >= max_depth:
+            return False
+        count = max(2, math.ceil(node.word_count / words_per_section))
+        answer = self.api_caller.call_api(
+            f"请为标题“{node.title}”拟定 {count} 个下一级子标题，每行一个，不要编号和其他说明"
+        ) or ""
+        # 去掉模型可能附带的编号，如 "1." "（一）" "-"
+        sub_titles = [re.sub(r"^[\s\-*•]*([(（]?[0-9一二三四五六七八九十]+[)）.、]\s*)?", "", line).strip()
+                      for line in answer.splitlines()]
+        sub_titles = list(dict.fromkeys(
+            parse_word_count(sub_title)[0] for sub_title in sub_titles if sub_title and sub_title != node.title
+        ))[:count]
+        if len(sub_titles) < 2:
+            return False
+        for sub_title in sub_titles:
+            child = node.add_child(OutlineNode(node.level + 1, sub_title, node.word_count // len(sub_titles)))
+            self._split_depth[child] = depth + 1
+        return True
+
+
+# AI 接口后端：每种后端负责把 prompt 发给对应的服务并取回文本，失败时返回 None
+class ApiBackend:
+    def __init__(self, endpoint, api_key=None, model=None, max_workers=4):
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.model = model
+        self.max_workers = max_workers
+
+    def generate(self, prompt, options=None):
+        """生成单条内容，options 为 Ollama 风格的生成参数（num_predict、num_ctx 等）"""
+        raise NotImplementedError
+
+    def generate_batch(self, prompts, options=None):
+        """批量生成，默认以有限并发逐条提交，结果顺序与 prompts 一致"""
+        if len(prompts) <= 1 or self.max_workers <= 1:
+            return [self.generate(prompt, options) for prompt in prompts]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts))) as executor:
+            return list(executor.map(lambda prompt: self.generate(prompt, options), prompts))
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+
+class OllamaBackend(ApiBackend):
+    """
+    Ollama /api/generate，服务端按 OLLAMA_NUM_PARALLEL 并行处理并发请求
+    endpoint 可以是多个地址（列表或逗号分隔），请求在各主机间负载均衡并自动故障切换
+    """
+
+    def __init__(self, endpoint, api_key=None, model=None, max_workers=4, max_per_host=4):
+        urls = endpoint.split(",") if isinstance(endpoint, str) else list(endpoint)
+        super().__init__(urls[0], api_key, model, max_workers)
+        self.pool = EndpointPool([url.strip() for url in urls], max_concurrency=max_per_host)
+
+    def _post(self, url, payload, usage):
+        response = get_default_client().post(url, json=payload, headers=self._headers())
+        response.raise_for_status()
+        data = response.json()
+        get_default_metrics().record_llm(data)
+        usage["decode_time"] = data["eval_duration"] / 1e9 if data.get("eval_duration") else None
+        return data.get("response")
+
+    def generate(self, prompt, options=None):
+        payload = {"model": self.model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        try:
+            # 经共享的自适应限流器发出，后端变慢或过载时自动降低并发
+            with get_default_limiter().slot() as usage:
+                return self.pool.call(lambda url: self._post(url, payload, usage))
+        except Exception as e:
+            print(f"调用 Ollama 接口失败：{e}")
+            return None
+
+
+class OpenAICompatibleBackend(ApiBackend):
+    """OpenAI 兼容的 /v1/completions，prompt 可以是列表，一次请求完成整批生成"""
+
+    def __init__(self, endpoint, api_key=None, model=None, max_workers=4, max_batch_size=16):
+        super().__init__(endpoint, api_key, model, max_workers)
+        self.max_batch_size = max_batch_size
+
+    def _complete(self, prompts, options=None):
+        payload = {"model": self.model, "prompt": prompts}
+        if options and options.get("num_predict"):
+            # 上下文长度由服务端的模型决定，这里只能限制生成长度
+            payload["max_tokens"] = options["num_predict"]
+        try:
+            response = get_default_client().post(self.endpoint, json=payload, headers=self._headers())
+            response.raise_for_status()
+            data = response.json()
+            choices = data.get("choices", [])
+            get_default_metrics().record_llm(data.get("usage"))
+        except Exception as e:
+            print(f"调用 OpenAI 兼容接口失败：{e}")
+            return [None] * len(prompts)
+        # 按 index 字段回填，保证与 prompts 顺序一致
+        results = [None] * len(prompts)
+        for position, choice in enumerate(choices):
+            index = choice.get("index", position)
+            if 0 <= index < len(results):
+                results[index] = choice.get("text")
+        return results
+
+    def generate(self, prompt, options=None):
+        return self._complete([prompt], options)[0]
+
+    def generate_batch(self, prompts, options=None):
+        batches = [prompts[i:i + self.max_batch_size] for i in range(0, len(prompts), self.max_batch_size)]
+        if len(batches) <= 1 or self.max_workers <= 1:
+            return [text for batch in batches for text in self._complete(batch, options)]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            batch_results = executor.map(lambda batch: self._complete(batch, options), batches)
+            return [text for batch_result in batch_results for text in batch_result]
+
+
+class LocalProcessBackend(ApiBackend):
+    """本地命令行程序：endpoint 为命令，prompt 从标准输入传入，标准输出作为生成结果；不支持生成参数"""
+
+    def generate(self, prompt, options=None):
+        try:
+            result = subprocess.run(
+                shlex.split(self.endpoint), input=prompt, capture_output=True, text=True, check=True
+            )
+            return result.stdout.strip()
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"调用本地程序失败：{e}")
+            return None
+
+
+class HuggingFaceBackend(ApiBackend):
+    """
+    本地 transformers 推理（huggingface/hf_backend.py），endpoint 为模型名称或本地路径，
+    同一层级的标题按长度分桶后批量生成，无需 HTTP 服务；
+    常驻模型守护进程（huggingface/model_daemon.py）在运行时直接复用其中已加载的模型
+    """
+
+    def __init__(self, endpoint, api_key=None, model=None, max_workers=4, dtype="bf16", max_batch_size=8):
+        super().__init__(endpoint, api_key, model or endpoint, max_workers)
+        from model_daemon import get_backend
+
+        self.hf = get_backend(self.model, dtype=dtype, max_batch_size=max_batch_size)
+
+    def generate(self, prompt, options=None):
+        return self.generate_batch([prompt], options)[0]
+
+    def generate_batch(self, prompts, options=None):
+        stats = {}
+        try:
+            results = self.hf.generate_batch(prompts, options, stats=stats)
+        except Exception as e:
+            print(f"本地模型生成失败：{e}")
+            return [None] * len(prompts)
+        get_default_metrics().record_llm(stats)
+        return results
+
+
+API_BACKENDS = {
+    "Ollama": OllamaBackend,
+    "OpenAI": OpenAICompatibleBackend,
+    "Local": LocalProcessBackend,
+    "HuggingFace": HuggingFaceBackend,
+}
 
 
 # 调用AI API生成内容
 class ApiCaller:
-    def __init__(self, api_type, api_key, endpoint):
+    def __init__(self, api_type, api_key, endpoint, model=None, cache=None, max_workers=4):
+        if api_type not in API_BACKENDS:
+            raise ValueError(f"不支持的 API 类型：{api_type}，可选值为 {list(API_BACKENDS)}")
         self.api_type = api_type
         self.api_key = api_key
         self.endpoint = endpoint
-
-    def call_api(self, prompt):
-        """调用AI生成内容"""
-        # 处理API调用，返回生成的内容
-        pass
+        self.model = model
+        self.cache = cache if cache is not None else get_default_cache()
+        self.backend = API_BACKENDS[api_type](endpoint, api_key=api_key, model=model, max_workers=max_workers)
+
+    def _cache_model(self):
+        return f"{self.api_type}:{self.endpoint}:{self.model}"
+
+    def call_api(self, prompt, options=None):
+        """调用AI生成内容，相同模型、提示词与生成参数的结果从缓存读取"""
+        return self.cache.cached(
+            self._cache_model(), prompt, lambda: self.backend.generate(prompt, options), params=options
+        )
+
+    def call_batch(self, prompts, options=None):
+        """
+        批量调用AI生成内容，未命中缓存的 prompt 一次性交给后端批量/并发提交
+        参数:
+            options: 整批共用的生成参数，如 {"num_predict": ..., "num_ctx": ...}
+        返回：与 prompts 顺序一致的结果列表，失败项为 None
+        """
+        model = self._cache_model()
+        keys = [self.cache.make_key(model, prompt, options) for prompt in prompts]
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            generated = self.backend.generate_batch([prompts[i] for i in missing], options)
+            for i, text in zip(missing, generated):
+                results[i] = text
+                self.cache.put(keys[i], text)
+        return results
 
 
 if __name__ == "__main__":
     # 示例用法
     doc_path = "./files/input/a_things.docx"
-    api_caller = ApiCaller("OpenAI", "OPENAI_API_KEY", "https://api.openai.com/v1/completions")
+    api_caller = ApiCaller(
+        "OpenAI", "OPENAI_API_KEY", "https://api.openai.com/v1/completions", model="gpt-3.5-turbo-instruct"
+    )
     doc_processor = DocProcessor(doc_path, api_caller)
     doc_processor.load_document()
 
@@ -201,5 +426,4 @@ if __name__ == "__main__":
     # doc_processor.fill_content(doc_processor.outline)
     
     # # 保存填充后的文档
-    # doc_processor.save_document("./files/output/a_things.docx")
-    doc_processor.extract_outline(doc_processor.document)
\ No newline at end of file
+    # doc_processor.save_document("./files/output/a_things.docx")
\ No newline at end of file
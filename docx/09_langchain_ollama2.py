@@ -1,45 +1,28 @@
 import os
+import time
+from collections import defaultdict
+from functools import lru_cache
 from langchain.prompts import PromptTemplate
-from langchain_ollama import OllamaLLM
-from docx import Document
+
+from endpoint_pool import HOST_ERRORS, get_default_pool
+from llm_cache import get_default_cache
+from metrics import get_default_metrics
+from ref_ingest import ParagraphStore, read_reference_file
+from prompt_budget import DEFAULT_WORD_COUNT, build_section_prompt, format_report
+from outline_reader import iter_outline
+from run_journal import RunJournal, section_key
+from stream_docx_writer import StreamingDocxWriter
+
+# 参考资料检索方式：substring - 标题原文匹配；semantic - 向量语义检索，可找到换了说法的需求
+RETRIEVAL_MODES = ("substring", "semantic")
 
 # 1. 定义读取大纲文件的函数，增加层级的支持
 def read_outline_from_docx(file_path):
-    document = Document(file_path)
-    outline = []
-    current_level = 1  # 初始层级为 1
-    
-    for para in document.paragraphs:
-        # 判断层级
-        if para.style.name.startswith('Heading'):
-            level = int(para.style.name.replace('Heading ', ''))
-            title = para.text.strip()
-            if level > current_level:
-                current_level = level  # 更新层级
-            elif level < current_level:
-                current_level = level  # 如果返回上一层级，更新层级
-            outline.append({"title": title, "word_count": None, "level": current_level})
-        else:
-            # 其他段落不作为标题处理
-            continue
-
-    return outline
-
-# 2. 定义保存文档的函数，支持多层级的标题
-def save_document_to_docx(content, output_file_path, outline):
-    doc = Document()
-    
-    for section in outline:
-        title = section["title"]
-        level = section["level"]
-        
-        # 根据层级设置标题样式
-        doc.add_heading(title, level=level)  # 根据层级自动选择 Heading 1, Heading 2, ..., Heading n
-
-        # 添加章节内容
-        doc.add_paragraph(content.get(section["title"], "无内容"))
-    
-    doc.save(output_file_path)
+    # 直接流式解析 document.xml，按样式ID/大纲级别识别标题
+    return [
+        {"title": title, "word_count": None, "level": level}
+        for level, title in iter_outline(file_path)
+    ]
 
 # 3. 设置大纲模板
 prompt_template = PromptTemplate(
@@ -47,98 +30,218 @@ prompt_template = PromptTemplate(
     template="请用中文写一篇关于 '{title}' 字数约 {word_count}。参考以下资料：{references}"
 )
 
-# 4. 初始化 Ollama LLM
-llm = OllamaLLM(model="llama3.2")
+# 4. Ollama 模型：客户端在首次调用时才创建，导入本模块不会连接 Ollama 或加载模型
+MODEL = "llama3.2"
+# 让 Ollama 在两次运行之间保持模型常驻，后续运行省去模型加载时间
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+
+@lru_cache(maxsize=None)
+def _llm_for(base_url, num_ctx=None, num_predict=None):
+    """按主机和生成参数复用 OllamaLLM 实例（同一模型的 num_ctx 保持不变，避免 Ollama 重新加载模型）"""
+    from langchain_ollama import OllamaLLM
+
+    if num_ctx is None:
+        return OllamaLLM(model=MODEL, base_url=base_url, keep_alive=KEEP_ALIVE)
+    return OllamaLLM(model=MODEL, base_url=base_url, keep_alive=KEEP_ALIVE, num_ctx=num_ctx, num_predict=num_predict)
+
+
+def cached_llm(prompt, options=None):
+    """
+    调用模型，相同模型、提示词与生成参数的结果从共享缓存读取
+    请求经共享地址池分发到多台 Ollama 主机，某台失败时切换到其他主机
+    """
+    options = options or {}
+
+    def call(base_url):
+        # generate 返回的 generation_info 带有 Ollama 的 token 数和耗时统计
+        result = _llm_for(base_url, options.get("num_ctx"), options.get("num_predict")).generate([prompt])
+        generation = result.generations[0][0]
+        get_default_metrics().record_llm(generation.generation_info)
+        return generation.text
+
+    def request():
+        # langchain_ollama 经 ollama 客户端（httpx）发送请求，它的连接错误和 HTTP 错误也算主机故障
+        import httpx
+        from ollama import ResponseError
+
+        return get_default_pool().call(call, host_errors=HOST_ERRORS + (httpx.HTTPError, ResponseError))
+
+    return get_default_cache().cached(MODEL, prompt, request, params=options or None)
 
 # 5. 参考资料模块
 class ReferenceModule:
     def __init__(self):
         self.references = {}
+        # 索引在加载参考资料后首次查找时构建一次
+        self._lowered_lines = []  # 小写化后的行，顺序为主文件在前、辅助文件在后
+        self._lines = []  # 与 _lowered_lines 对应的原始行
+        self._bigram_index = None  # 字二元组 -> 包含它的行号集合
+        self.vector_store = None  # 启用语义检索后的向量库
+
+    def enable_semantic_search(self, store_dir=None, model="nomic-embed-text"):
+        """
+        启用语义检索：把已加载的参考资料按段落切块并计算向量，
+        向量库按内容哈希增量更新，只为新增或有变化的文件重新计算
+        """
+        from vector_store import DEFAULT_STORE_DIR, VectorStore
+
+        self.vector_store = VectorStore(store_dir or DEFAULT_STORE_DIR, model=model)
+        documents = {name: "\n".join(lines) for name, lines in self.references.items()}
+        embedded = self.vector_store.update(documents)
+        print(f"向量库共 {self.vector_store.manifest['count']} 个段落，本次新计算 {embedded} 个")
 
     def load_main_reference(self, main_reference_file):
-        """加载主参考资料文件"""
+        """加载主参考资料文件，支持 .txt / .docx / .doc，内容按段落保存"""
         if os.path.exists(main_reference_file):
-            with open(main_reference_file, "r", encoding="utf-8") as file:
-                content = file.read().splitlines()
-            self.references["main_file"] = content
+            self.references["main_file"] = read_reference_file(main_reference_file)
+            self._bigram_index = None
         else:
             print(f"警告：主参考文件 {main_reference_file} 未找到。")
 
     def load_auxiliary_references(self, reference_folder):
-        """加载辅助参考资料文件夹中的所有文件"""
+        """
+        加载辅助参考资料文件夹（含子文件夹）中的 .txt / .docx / .doc 文件
+        用进程池并行解析，未变化的文件直接读取上次的解析结果
+        """
         if os.path.exists(reference_folder):
-            for file_name in os.listdir(reference_folder):
-                file_path = os.path.join(reference_folder, file_name)
-                if os.path.isfile(file_path) and file_name.endswith(".txt"):  # 只加载 .txt 文件
-                    with open(file_path, "r", encoding="utf-8") as file:
-                        content = file.read().splitlines()
-                    self.references[file_name] = content
+            store = ParagraphStore(reference_folder)
+            result = store.update()
+            print(f"参考资料：解析 {result['parsed']} 个文件，跳过未变化的 {result['skipped']} 个")
+            self.references.update(store.load())
+            self._bigram_index = None
         else:
             print(f"警告：参考资料文件夹 {reference_folder} 未找到。")
 
-    def get_references_for_section(self, section_title):
-        """根据章节标题提取相关的参考资料"""
-        references = []
-        # 先从主参考文件中查找
-        if "main_file" in self.references:
-            for line in self.references["main_file"]:
-                if section_title.lower() in line.lower():
-                    references.append(line)
-        
-        # 从辅助参考文件中查找
+    def _build_index(self):
+        """对所有参考资料行做一次小写化，并建立字二元组倒排索引"""
+        self._lines = list(self.references.get("main_file", []))
         for ref_file, ref_content in self.references.items():
-            if ref_file != "main_file":  # 排除主文件
-                for line in ref_content:
-                    if section_title.lower() in line.lower():
-                        references.append(line)
+            if ref_file != "main_file":  # 主文件已排在最前
+                self._lines.extend(ref_content)
+        self._lowered_lines = [line.lower() for line in self._lines]
+        self._bigram_index = defaultdict(set)
+        for line_no, lowered in enumerate(self._lowered_lines):
+            for i in range(len(lowered) - 1):
+                self._bigram_index[lowered[i:i + 2]].add(line_no)
+
+    def _candidate_lines(self, query):
+        """用二元组倒排索引求候选行，短于两个字符的查询退化为逐行扫描"""
+        if len(query) < 2:
+            return range(len(self._lowered_lines))
+        postings = [self._bigram_index.get(query[i:i + 2]) for i in range(len(query) - 1)]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+        return sorted(postings[0].intersection(*postings[1:]))
+
+    def get_references_for_section(self, section_title, with_scores=False, top_k=8):
+        """
+        根据章节标题提取相关的参考资料
+        参数:
+            with_scores: 为 True 时返回 (行, 标题在该行中出现的次数)；语义检索时为 (段落, 余弦相似度)
+            top_k: 语义检索返回的段落数
+        返回：包含标题的行，主参考文件在前，辅助参考文件在后；语义检索时为最相似的段落
+        """
+        if self.vector_store is not None:
+            hits = self.vector_store.search(section_title, top_k=top_k)
+            return [(text, score) for _, text, score in hits] if with_scores else [text for _, text, _ in hits]
+        if self._bigram_index is None:
+            self._build_index()
+        query = section_title.lower()
+        references = []
+        for line_no in self._candidate_lines(query):
+            lowered = self._lowered_lines[line_no]
+            if query in lowered:  # 候选行仍需确认是否真正包含标题
+                line = self._lines[line_no]
+                references.append((line, lowered.count(query)) if with_scores else line)
         return references
 
     def format_references(self, references):
         """将参考资料格式化为字符串"""
         return "\n".join(references) if references else "无参考资料"
 
-def main():
-    # 6. 配置文件路径（在这里修改路径）
-    outline_file_path = "files/input/input.docx"  # 大纲文件路径
-    main_reference_file_path = "files/references/tender.docx"  # 主参考资料文件路径
-    auxiliary_reference_folder = ""  # 辅助参考资料文件夹路径
-    output_file_path = "files/output/file.docx"  # 输出文件路径
+# 6. 配置文件路径（在这里修改路径）
+def main(
+    outline_file_path="files/input/input.docx",  # 大纲文件路径
+    main_reference_file_path="files/references/tender.docx",  # 主参考资料文件路径
+    auxiliary_reference_folder="",  # 辅助参考资料文件夹路径
+    output_file_path="files/output/file.docx",  # 输出文件路径
+    retrieval="substring",  # 参考资料检索方式，见 RETRIEVAL_MODES
+):
+    if retrieval not in RETRIEVAL_MODES:
+        raise ValueError(f"未知的检索方式：{retrieval}，可选值为 {RETRIEVAL_MODES}")
+
+    metrics = get_default_metrics()
+    metrics.reset()
 
     # 7. 读取本地大纲文件
-    outline = read_outline_from_docx(outline_file_path)
+    with metrics.stage("read_outline"):
+        outline = read_outline_from_docx(outline_file_path)
 
     # 8. 参考资料模块（加载主参考文件和辅助参考文件夹）
     reference_module = ReferenceModule()
 
-    # 加载主参考文件
-    if main_reference_file_path:
-        reference_module.load_main_reference(main_reference_file_path)
+    with metrics.stage("load_references"):
+        # 加载主参考文件
+        if main_reference_file_path:
+            reference_module.load_main_reference(main_reference_file_path)
 
-    # 加载辅助参考文件夹
-    if auxiliary_reference_folder:
-        reference_module.load_auxiliary_references(auxiliary_reference_folder)
+        # 加载辅助参考文件夹
+        if auxiliary_reference_folder:
+            reference_module.load_auxiliary_references(auxiliary_reference_folder)
 
-    # 9. 生成每个章节内容并合成文档
-    content = {}
-    for section in outline:
-        # 如果参考资料存在，则添加参考资料；如果没有，则不加入参考资料
-        references = reference_module.get_references_for_section(section["title"])
-        formatted_references = reference_module.format_references(references)
-        
-        # 如果没有字数，AI自动决定字数
-        if section["word_count"] is None:
-            prompt = prompt_template.format(title=section["title"], word_count=1000, references=formatted_references)  # 默认1000字
-            section_content = llm(prompt)  # 直接调用模型
-            content[section["title"]] = section_content
-        else:
-            prompt = prompt_template.format(title=section["title"], word_count=section["word_count"], references=formatted_references)
-            section_content = llm(prompt)  # 直接调用模型
-            content[section["title"]] = section_content
+    if retrieval == "semantic":
+        with metrics.stage("build_vector_store"):
+            reference_module.enable_semantic_search()
 
-    # 10. 保存生成的文档
-    save_document_to_docx(content, output_file_path, outline)
+    # 9. 生成每个章节内容并合成文档
+    # 运行日志：每完成一个章节立即落盘，中断后重新运行只生成未完成或有变化的章节
+    journal = RunJournal(output_file_path + ".journal.jsonl")
+    keys = []
+    # 边生成边写入：每个章节完成后立即写进文档，不在内存中积累整篇内容
+    with StreamingDocxWriter(output_file_path) as writer:
+        for pos, section in enumerate(outline):
+            section_start = time.perf_counter()
+            # 如果参考资料存在，则添加参考资料；如果没有，则不加入参考资料
+            with metrics.stage("reference_lookup"):
+                references = reference_module.get_references_for_section(section["title"])
+
+            # 如果没有字数，AI自动决定字数（默认1000字）
+            word_count = section["word_count"] or DEFAULT_WORD_COUNT
+            # 参考资料按优先级装入，不超过模型上下文预算，并报告丢弃了多少
+            with metrics.stage("build_prompt"):
+                prompt, options, report = build_section_prompt(
+                    lambda refs: prompt_template.format(
+                        title=section["title"], word_count=word_count, references=refs or "无参考资料"
+                    ),
+                    references,
+                    MODEL,
+                    word_count,
+                )
+            if report["dropped"]:
+                print(format_report(section["title"], report))
+
+            key = section_key(section["level"], section["title"], MODEL, prompt, options)
+            keys.append(key)
+            section_content = journal.lookup(key)
+            if section_content is None:
+                with metrics.stage("llm"):
+                    section_content = cached_llm(prompt, options)  # 调用模型（带缓存）
+                journal.record(pos, key, section["level"], section["title"], section_content)
+            # 10. 写入章节标题和生成的内容
+            with metrics.stage("write_docx"):
+                writer.add_heading(section["title"], level=section["level"])
+                writer.add_paragraph(section_content or "无内容")
+            metrics.record_section(
+                section["title"], time.perf_counter() - section_start, level=section["level"],
+                references=report["kept"], prompt_tokens=report["prompt_tokens"],
+            )
+    journal.compact(keys)
 
     print(f"文档已保存到 {output_file_path}")
+    print(f"LLM 缓存统计：{get_default_cache().stats()}")
+    print(f"性能报告：{'，'.join(metrics.write(output_file_path))}")
 
 if __name__ == "__main__":
     main()
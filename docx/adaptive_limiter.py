@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import get_default_metrics
+
+# 视为服务端过载的 HTTP 状态码
+OVERLOAD_STATUS = {429, 503}
+
+
+def is_overload(error):
+    """判断异常是否表示后端过载：超时、429 或 503"""
+    if "Timeout" in type(error).__name__:
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) in OVERLOAD_STATUS
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发限制：
+    - 没有排队时，每经过约一个“窗口”的成功请求，并发上限加 1（加性增）
+    - 出现超时、429/503，或排队时间上升时，上限按比例下降（乘性减）
+    各章节生成的长度差别很大，整次请求的耗时主要取决于回答长度，不能反映排队，
+    因此延迟取“开始解码之前的耗时”（排队 + prompt 处理，相当于首字延迟）：整次耗时减去调用方报告的解码耗时；
+    基线取最近若干次的低分位数（不排队时的解码前耗时），高出基线的部分即请求在服务端的排队时间。
+    排队时间的滑动平均超过基线的 latency_tolerance - 1 倍（默认 25%）时降低上限，
+    上限在服务端处理能力附近小幅波动，服务端几乎不排队（bench_limiter.py 会检查这一点）
+    没有报告解码耗时的请求只根据超时和过载错误调整
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64, backoff_ratio=0.5, queue_backoff_ratio=0.75,
+                 latency_tolerance=1.25, ewma_alpha=0.2, baseline_window=1000, baseline_percentile=0.05, min_samples=10):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.queue_backoff_ratio = queue_backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.ewma_alpha = ewma_alpha
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.baseline_percentile = baseline_percentile
+        self.min_samples = min_samples
+        self.latency_ewma = None  # 解码前耗时（秒）的滑动平均
+        self.baseline_latency = None
+        self._samples = deque(maxlen=baseline_window)
+        self._request_ewma = None  # 整次请求耗时的滑动平均，用于限制降速频率
+        self.queue_time_ewma = 0.0  # 服务端排队时间（解码前耗时高出基线的部分）的滑动平均
+        self.wait_time_ewma = 0.0  # 在本限流器前等待名额的时间，反映的是请求量而不是服务端拥塞
+        self.overloads = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """等待并发名额，返回等待耗时"""
+        start = time.perf_counter()
+        with self._cond:
+            self.queue_depth += 1
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.queue_depth -= 1
+            self.in_flight += 1
+            wait_time = time.perf_counter() - start
+            self.wait_time_ewma += self.ewma_alpha * (wait_time - self.wait_time_ewma)
+        return wait_time
+
+    def release(self, latency, overloaded=False, decode_time=None):
+        """
+        归还名额并根据本次请求的结果调整并发上限
+        参数:
+            decode_time: 本次请求的解码耗时（秒），给出时按解码前的耗时判断服务端是否在排队
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None:
+                self._request_ewma = latency if self._request_ewma is None else (
+                    self._request_ewma + self.ewma_alpha * (latency - self._request_ewma))
+            if overloaded:
+                self.overloads += 1
+                get_default_metrics().inc("overloads")
+                self._decrease()
+            elif latency is not None:
+                self._on_success(max(latency - decode_time, 0.0) if decode_time is not None else None)
+            self._cond.notify_all()
+
+    def _on_success(self, wait):
+        if wait is not None:
+            self._samples.append(wait)
+            if self.latency_ewma is None:
+                self.latency_ewma = wait
+            else:
+                self.latency_ewma += self.ewma_alpha * (wait - self.latency_ewma)
+            # 基线取最近若干次的低分位数：不会被一次偶然的快速响应永久锁定，负载变化后也能跟上
+            ordered = sorted(self._samples)
+            self.baseline_latency = ordered[int(len(ordered) * self.baseline_percentile)]
+            queue_time = max(wait - self.baseline_latency, 0.0)
+            self.queue_time_ewma += self.ewma_alpha * (queue_time - self.queue_time_ewma)
+            allowed = self.baseline_latency * (self.latency_tolerance - 1)
+            if len(ordered) >= self.min_samples and self.queue_time_ewma > allowed:
+                # 排队是渐进的信号，比超时和 503 降得温和
+                self._decrease(self.queue_backoff_ratio)
+                return
+        if self.in_flight + 1 >= int(self.limit):
+            # 只有名额被用满时才增加，避免在低负载时无限上涨
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _decrease(self, ratio=None):
+        # 一个延迟周期内只降一次，避免同一波过载导致连续多次减半
+        now = time.monotonic()
+        if now - self._last_decrease < (self._request_ewma or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * (ratio or self.backoff_ratio))
+
+    @contextmanager
+    def slot(self):
+        """
+        占用一个名额执行代码块，按执行结果调整并发上限
+        产出一个字典，代码块可写入 usage["decode_time"]（解码耗时，秒，可取自 Ollama 的 eval_duration）
+        """
+        self.acquire()
+        usage = {}
+        start = time.perf_counter()
+        try:
+            yield usage
+        except Exception as e:
+            self.release(None, overloaded=is_overload(e))
+            raise
+        self.release(time.perf_counter() - start, decode_time=usage.get("decode_time"))
+
+    def metrics(self):
+        """当前并发上限、执行中请求数、排队数及延迟指标"""
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "latency_ewma": self.latency_ewma,
+                "baseline_latency": self.baseline_latency,
+                "queue_time_ewma": self.queue_time_ewma,
+                "wait_time_ewma": self.wait_time_ewma,
+                "overloads": self.overloads,
+            }
+
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+def get_default_limiter():
+    """
+    返回所有 Ollama 调用共享的自适应限流器
+    可通过环境变量 OLLAMA_INITIAL_CONCURRENCY / OLLAMA_MAX_CONCURRENCY 调整初始值和上限
+    """
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = AdaptiveLimiter(
+                initial_limit=int(os.environ.get("OLLAMA_INITIAL_CONCURRENCY", "2")),
+                max_limit=int(os.environ.get("OLLAMA_MAX_CONCURRENCY", "32")),
+            )
+        return _default_limiter
@@ -0,0 +1,67 @@
+"""
+参考资料解析基准测试：生成一批 .txt / .docx 参考文件，分别用不同进程数全量解析，
+再测一次无变化时的增量更新耗时。
+
+用法：
+    python docx/bench_ingest.py --files 2000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from ref_ingest import ParagraphStore  # noqa: E402
+
+_SYLLABLES = "项目建设施工设备安装调试验收培训服务质量进度安全管理技术方案系统平台数据网络"
+
+
+def make_references(folder, files, paragraphs, docx_ratio, seed=0):
+    """生成参考资料文件，约 docx_ratio 比例为 .docx（需要 python-docx），其余为 .txt"""
+    rng = random.Random(seed)
+    for i in range(files):
+        lines = ["".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(20, 200))) for _ in range(paragraphs)]
+        sub_dir = os.path.join(folder, f"group{i % 10}")
+        os.makedirs(sub_dir, exist_ok=True)
+        if rng.random() < docx_ratio:
+            from docx import Document
+
+            document = Document()
+            for line in lines:
+                document.add_paragraph(line)
+            document.save(os.path.join(sub_dir, f"ref{i}.docx"))
+        else:
+            with open(os.path.join(sub_dir, f"ref{i}.txt"), "w", encoding="utf-8") as file:
+                file.write("\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="参考资料并行解析基准测试")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--paragraphs", type=int, default=100, help="每个文件的段落数")
+    parser.add_argument("--docx-ratio", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        folder = os.path.join(work_dir, "refs")
+        make_references(folder, args.files, args.paragraphs, args.docx_ratio)
+        baseline = None
+        for workers in args.workers:
+            store_dir = os.path.join(work_dir, f"store_{workers}")
+            start = time.perf_counter()
+            result = ParagraphStore(folder, store_dir, max_workers=workers).update()
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{workers:>3} 个进程：解析 {result['parsed']} 个文件用时 {elapsed:.2f}s，加速比 {baseline / elapsed:.2f}")
+        start = time.perf_counter()
+        result = ParagraphStore(folder, store_dir).update()
+        print(f"无变化时增量更新：跳过 {result['skipped']} 个文件，用时 {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
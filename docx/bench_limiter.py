@@ -0,0 +1,102 @@
+"""
+自适应限流演示：启动一个处理能力有限的模拟 Ollama 服务，
+用大量线程经 AdaptiveLimiter 发请求，每秒打印并发上限、排队数和吞吐量，
+观察上限如何收敛到服务端的处理能力附近；后半程的并发上限中位数不在处理能力的 0.5~1.5 倍之间时以非零状态退出。
+
+用法：
+    python docx/bench_limiter.py --capacity 4 --threads 32 --requests 400 --latency 0.1
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from adaptive_limiter import AdaptiveLimiter  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+from mock_ollama_server import MockOllamaServer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="自适应并发限流演示")
+    parser.add_argument("--capacity", type=int, default=4, help="模拟服务端可并行处理的请求数")
+    parser.add_argument("--threads", type=int, default=32, help="客户端线程数（并发上限的上界）")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--tokens", type=int, default=64, help="最长的生成长度，每个请求在 1/16 到该值之间随机")
+    parser.add_argument("--tokens-per-sec", type=float, default=400.0)
+    parser.add_argument("--initial-limit", type=int, default=2)
+    args = parser.parse_args()
+
+    server = MockOllamaServer(0, args.latency, args.tokens_per_sec, 0.0, args.tokens, args.capacity).start()
+    limiter = AdaptiveLimiter(initial_limit=args.initial_limit, max_limit=args.threads)
+    # 每主机连接数不设额外上限：发往服务端的并发只由限流器控制，HTTP 客户端里不会出现第二个排队点
+    client = HttpClient(max_per_host=args.threads, max_retries=0)
+    url = f"{server.base_url}/api/generate"
+    done = []
+    failed = []
+
+    def post(num_predict):
+        payload = {"model": "mock", "prompt": "hi", "stream": False, "options": {"num_predict": num_predict}}
+        response = client.post(url, json=payload, headers={"Content-Type": "application/json"})
+        response.raise_for_status()
+        return response.json()
+
+    def task(i):
+        # 生成长度在 1/16 到全长之间变化，与实际章节一样长短不一
+        num_predict = random.Random(i).randint(max(1, args.tokens // 16), args.tokens)
+        try:
+            with limiter.slot() as usage:
+                usage["decode_time"] = post(num_predict)["eval_duration"] / 1e9
+            done.append(1)
+        except Exception:
+            failed.append(1)
+
+    finished = threading.Event()
+    limits = []  # 每 0.1 秒记录一次并发上限
+
+    def report():
+        last, start = 0, time.perf_counter()
+        while not finished.wait(0.1):
+            metrics = limiter.metrics()
+            limits.append(metrics["limit"])
+            if len(limits) % 10:
+                continue
+            print(
+                f"{time.perf_counter() - start:5.1f}s  上限 {metrics['limit']:>3}  执行中 {metrics['in_flight']:>3}  "
+                f"排队 {metrics['queue_depth']:>3}  吞吐 {len(done) - last:>4} 次/秒  "
+                f"解码前延迟 {metrics['latency_ewma'] or 0:.3f}s（基线 {metrics['baseline_latency'] or 0:.3f}s，"
+                f"服务端排队 {metrics['queue_time_ewma']:.3f}s）"
+            )
+            last = len(done)
+
+    reporter = threading.Thread(target=report, daemon=True)
+    reporter.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(task, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    finished.set()
+    reporter.join()
+    server.shutdown()
+
+    print(
+        f"完成 {len(done)} 次，失败 {len(failed)} 次，用时 {elapsed:.1f}s，"
+        f"服务端最大并发 {server.stats['max_in_flight']}，503 次数 {server.stats['errors']}"
+    )
+    if args.capacity and limits:
+        # 前半程是从初始值爬升的过程，只检查后半程
+        settled = sorted(limits[len(limits) // 2:])
+        median = settled[len(settled) // 2]
+        print(f"后半程并发上限：中位数 {median}，范围 {settled[0]}~{settled[-1]}（服务端处理能力 {args.capacity}）")
+        if not args.capacity * 0.5 <= median <= args.capacity * 1.5:
+            sys.exit(f"并发上限没有收敛到处理能力附近：中位数 {median}，处理能力 {args.capacity}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+对比 python-docx 与 outline_reader 读取目录大纲的耗时和峰值内存
+
+用法：python docx/bench_outline.py <docx 文件> [重复次数]
+每种实现在独立子进程中运行，峰值内存取子进程的最大常驻内存（RSS）
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_outline_with_python_docx(docx_path):
+    """原有实现：构建完整的 python-docx 文档对象后遍历段落"""
+    from docx import Document
+
+    document = Document(docx_path)
+    outline = []
+    for paragraph in document.paragraphs:
+        if paragraph.style.name.startswith("Heading"):
+            level = int(paragraph.style.name.split(" ")[1])
+            outline.append((level, paragraph.text.strip()))
+    return outline
+
+
+def run_worker(name, docx_path, repeat):
+    """子进程：运行指定实现并输出 JSON 结果"""
+    if name == "python-docx":
+        func = read_outline_with_python_docx
+    else:
+        sys.path.insert(0, HERE)
+        from outline_reader import read_outline as func
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outline = func(docx_path)
+        timings.append(time.perf_counter() - start)
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        max_rss //= 1024
+    print(json.dumps({"outline": outline, "best": min(timings), "max_rss_kb": max_rss}, ensure_ascii=False))
+
+
+def main(docx_path, repeat=3):
+    results = {}
+    for name in ("python-docx", "outline_reader"):
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", name, docx_path, str(repeat)],
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            print(f"{name} 运行失败：{proc.stderr.strip()}")
+            continue
+        results[name] = json.loads(proc.stdout)
+        print(f"{name:>15}: 最快 {results[name]['best'] * 1000:.1f} ms，峰值 RSS {results[name]['max_rss_kb'] / 1024:.1f} MB")
+
+    if len(results) == 2:
+        same = results["python-docx"]["outline"] == results["outline_reader"]["outline"]
+        print(f"两种实现结果一致：{same}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    elif len(sys.argv) > 1:
+        main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 3)
+    else:
+        print(__doc__)
@@ -0,0 +1,226 @@
+"""
+端到端基准测试：大纲 -> prompt -> LLM -> docx
+
+启动本地模拟 Ollama 服务，生成不同规模的合成大纲和需求文件，
+分别运行 01.py 的 main、09_langchain_ollama2.py 的 main 和 DocProcessor，
+报告总耗时、各阶段耗时、峰值内存和 prompt token 总数。
+
+用法：
+    python docx/bench_pipeline.py --headings 10 100 1000 --req-sizes 1KB 1MB \\
+        --targets 01 09 docproc --latency 0.05 --tokens-per-sec 0 --report bench_report.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from mock_ollama_server import MockOllamaServer  # noqa: E402
+
+TARGETS = ("01", "09", "docproc")
+_SYLLABLES = "项目建设施工设备安装调试验收培训服务质量进度安全管理技术方案系统平台数据网络"
+
+
+def parse_size(text):
+    """把 1KB / 10MB 之类的字符串转成字节数"""
+    units = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "B": 1}
+    for unit, factor in units.items():
+        if text.upper().endswith(unit):
+            return int(float(text[: -len(unit)]) * factor)
+    return int(text)
+
+
+def load_script(name, file_name):
+    """按路径加载以数字开头、无法直接 import 的脚本"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_outline_docx(path, headings, seed=0):
+    """生成包含指定数量标题的大纲文件，层级在 1~3 之间合理跳变"""
+    from docx import Document
+
+    rng = random.Random(seed)
+    document = Document()
+    level = 1
+    for i in range(headings):
+        level = rng.randint(1, min(level + 1, 3)) if i else 1
+        title = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(4, 10)))
+        document.add_heading(f"{i + 1} {title}", level=level)
+    document.save(path)
+
+
+def make_requirements(path, size, seed=0):
+    """生成约 size 字节的需求文件：.docx 供 01.py 使用，.txt 供 09 使用"""
+    rng = random.Random(seed)
+    paragraphs = []
+    total = 0
+    while total < size:
+        paragraph = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(20, 200))) + "。"
+        paragraphs.append(paragraph)
+        total += len(paragraph.encode("utf-8")) + 1
+    if path.endswith(".docx"):
+        from docx import Document
+
+        document = Document()
+        for paragraph in paragraphs:
+            document.add_paragraph(paragraph)
+        document.save(path)
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("\n".join(paragraphs))
+
+
+def _timed(module, name, stages):
+    """替换模块中的函数，记录每次调用的累计耗时"""
+    func = getattr(module, name)
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+    setattr(module, name, wrapper)
+
+
+def run_target(target, outline_path, req_docx, req_txt, work_dir, base_url):
+    """子进程中运行单个目标，返回各阶段耗时"""
+    stages = {}
+    output_path = os.path.join(work_dir, f"out_{target}.docx")
+    if target == "01":
+        module = load_script("script_01", "01.py")
+        # 01 的文档写入与生成同时进行，计入 match_and_fill_outline_with_ollama
+        for name in ("read_outline_from_docx", "read_and_analyze_requirements", "match_and_fill_outline_with_ollama"):
+            _timed(module, name, stages)
+        module.main(outline_path, req_docx, output_path, model="mock", max_workers=4, resume=False)
+    elif target == "09":
+        module = load_script("script_09", "09_langchain_ollama2.py")
+        _timed(module, "read_outline_from_docx", stages)
+        _timed(module, "cached_llm", stages)
+        _timed(module.ReferenceModule, "get_references_for_section", stages)
+        module.main(outline_path, req_txt, "", output_path)
+    else:
+        module = load_script("script_05", "05_class.py")
+        for name in ("load_document", "fill_content", "save_document"):
+            _timed(module.DocProcessor, name, stages)
+        caller = module.ApiCaller("Ollama", None, f"{base_url}/api/generate", model="mock")
+        processor = module.DocProcessor(outline_path, caller)
+        processor.load_document()
+        processor.fill_content(processor.outline)
+        processor.save_document(output_path)
+    return stages
+
+
+def worker_main(args):
+    start = time.perf_counter()
+    stages = run_target(args.target, args.outline, args.req_docx, args.req_txt, args.work_dir, args.base_url)
+    wall = time.perf_counter() - start
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        max_rss //= 1024
+    print("BENCH_RESULT " + json.dumps({"wall": wall, "stages": stages, "max_rss_kb": max_rss}))
+
+
+def run_scenario(server, target, headings, req_size, work_dir):
+    """在独立子进程中运行一个场景，避免各场景的内存和缓存互相影响"""
+    outline_path = os.path.join(work_dir, f"outline_{headings}.docx")
+    req_docx = os.path.join(work_dir, f"req_{req_size}.docx")
+    req_txt = os.path.join(work_dir, f"req_{req_size}.txt")
+    if not os.path.exists(outline_path):
+        make_outline_docx(outline_path, headings)
+    if not os.path.exists(req_docx):
+        make_requirements(req_docx, req_size)
+        make_requirements(req_txt, req_size)
+
+    env = dict(
+        os.environ,
+        OLLAMA_BASE_URL=server.base_url,
+        OLLAMA_HOSTS=server.base_url,
+        LLM_CACHE_MODE="bypass",
+        LLM_CACHE_PATH=os.path.join(work_dir, "cache.sqlite"),
+    )
+    run_dir = tempfile.mkdtemp(dir=work_dir)
+    server.reset_stats()
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", "--target", target,
+         "--outline", outline_path, "--req-docx", req_docx, "--req-txt", req_txt,
+         "--work-dir", run_dir, "--base-url", server.base_url],
+        capture_output=True, text=True, env=env,
+    )
+    result = {"target": target, "headings": headings, "req_bytes": req_size, "server": dict(server.stats)}
+    for line in proc.stdout.splitlines():
+        if line.startswith("BENCH_RESULT "):
+            result.update(json.loads(line[len("BENCH_RESULT "):]))
+            break
+    else:
+        result["error"] = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"
+    return result
+
+
+def print_result(result):
+    if "error" in result:
+        print(f"[{result['target']:>7}] {result['headings']:>5} 标题 / {result['req_bytes']:>10} B  失败：{result['error']}")
+        return
+    stages = "，".join(f"{name} {seconds:.2f}s" for name, seconds in result["stages"].items())
+    print(
+        f"[{result['target']:>7}] {result['headings']:>5} 标题 / {result['req_bytes']:>10} B  "
+        f"总耗时 {result['wall']:.2f}s  峰值 RSS {result['max_rss_kb'] / 1024:.1f} MB  "
+        f"prompt tokens {result['server']['prompt_tokens']}  请求数 {result['server']['requests']}\n          {stages}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文档生成流水线端到端基准测试")
+    parser.add_argument("--headings", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--req-sizes", nargs="+", default=["1KB", "1MB"])
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--report", default="", help="把结果写入 JSON 文件，便于跨版本对比")
+    # 以下参数仅供子进程使用
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--target", help=argparse.SUPPRESS)
+    parser.add_argument("--outline", help=argparse.SUPPRESS)
+    parser.add_argument("--req-docx", help=argparse.SUPPRESS)
+    parser.add_argument("--req-txt", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return
+
+    server = MockOllamaServer(0, args.latency, args.tokens_per_sec, args.error_rate, args.completion_tokens).start()
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for req_size in map(parse_size, args.req_sizes):
+            for headings in args.headings:
+                for target in args.targets:
+                    result = run_scenario(server, target, headings, req_size, work_dir)
+                    print_result(result)
+                    results.append(result)
+    server.shutdown()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump({"created": time.time(), "args": vars(args), "results": results}, file, ensure_ascii=False, indent=2)
+        print(f"报告已保存到 {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+
+import requests
+
+from metrics import get_default_metrics
+
+# 调度策略：
+#   least_outstanding - 选择当前未完成请求最少的主机
+#   latency           - 选择 平均延迟 ×（未完成请求数 + 1） 最小的主机
+STRATEGIES = ("least_outstanding", "latency")
+# 只有连接、超时和 HTTP 错误说明主机有问题；模型返回的业务错误（如 Ollama 的 error 行）不计入主机故障
+HOST_ERRORS = (requests.RequestException, OSError)
+
+
+class Endpoint:
+    """一个推理服务地址及其运行状态"""
+
+    __slots__ = ("url", "max_concurrency", "outstanding", "ewma_latency", "consecutive_failures", "ejected_until",
+                 "requests", "failures")
+
+    def __init__(self, url, max_concurrency):
+        self.url = url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.ewma_latency = None  # 指数加权平均延迟，秒
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def healthy(self, now):
+        return self.ejected_until <= now
+
+    def available(self, now):
+        """
+        正常状态下可用；被摘除的主机冷却期结束后进入半开状态，
+        此时只有没有未完成请求时才放行，一次只有一个探测请求
+        """
+        if self.ejected_until == 0.0:
+            return True
+        return self.ejected_until <= now and self.outstanding == 0
+
+    def cost(self, strategy):
+        if strategy == "latency" and self.ewma_latency is not None:
+            return self.ewma_latency * (self.outstanding + 1)
+        return self.outstanding
+
+
+class EndpointPool:
+    """
+    多个 Ollama 主机组成的地址池：
+    - 按最少未完成请求数或延迟加权选择主机，每台主机有并发上限
+    - 被动健康检查：连续失败若干次后暂时摘除，冷却期过后进入半开状态，只放行一个探测请求，
+      探测成功才恢复正常调度，失败则重新摘除
+    - 连接、超时或 HTTP 错误时自动切换到其他主机重试
+    """
+
+    def __init__(self, urls, max_concurrency=4, strategy="least_outstanding", eject_after=3, eject_seconds=30.0,
+                 ewma_alpha=0.3):
+        if not urls:
+            raise ValueError("地址池至少需要一个地址")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的调度策略：{strategy}，可选值为 {STRATEGIES}")
+        self.endpoints = [Endpoint(url, max_concurrency) for url in urls]
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.ewma_alpha = ewma_alpha
+        self._cond = threading.Condition()
+
+    def _pick(self, exclude):
+        now = time.monotonic()
+        candidates = [ep for ep in self.endpoints if ep not in exclude and ep.outstanding < ep.max_concurrency]
+        available = [ep for ep in candidates if ep.available(now)]
+        if available:
+            return min(available, key=lambda ep: ep.cost(self.strategy))
+        if any(ep.healthy(now) for ep in self.endpoints if ep not in exclude):
+            return None  # 有健康主机但已满，或半开主机的探测请求尚未返回，等待
+        # 全部被摘除时，放行冷却期最早结束的主机作为探测
+        return min(candidates, key=lambda ep: ep.ejected_until) if candidates else None
+
+    def acquire(self, exclude=(), timeout=None):
+        """选出一个主机并占用一个并发名额，超时返回 None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if all(ep in exclude for ep in self.endpoints):
+                    return None
+                endpoint = self._pick(exclude)
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    endpoint.requests += 1
+                    return endpoint
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                # 名额释放或冷却期结束时重新选择
+                self._cond.wait(timeout=min(remaining or 1.0, 1.0))
+
+    def release(self, endpoint, ok=True, latency=None):
+        """
+        归还名额并更新健康状态与延迟统计
+        参数:
+            ok: True 表示主机正常，False 表示主机故障，None 表示结果与主机健康无关（只归还名额）
+        """
+        with self._cond:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_until = 0.0
+                if latency is not None:
+                    if endpoint.ewma_latency is None:
+                        endpoint.ewma_latency = latency
+                    else:
+                        endpoint.ewma_latency += self.ewma_alpha * (latency - endpoint.ewma_latency)
+            elif ok is False:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.eject_after:
+                    endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                    print(f"主机 {endpoint.url} 连续失败 {endpoint.consecutive_failures} 次，暂停使用 {self.eject_seconds:.0f} 秒")
+            self._cond.notify_all()
+
+    def call(self, func, host_errors=HOST_ERRORS):
+        """
+        在选出的主机上执行 func(url)，连接、超时或 HTTP 错误时切换到其他主机，所有主机都失败后抛出最后一个异常；
+        其他异常（如模型返回的错误）不计入主机故障，直接抛出
+        参数:
+            host_errors: 视为主机故障的异常类型，func 使用其他 HTTP 库时需要补充
+        """
+        tried = set()
+        last_error = None
+        while True:
+            endpoint = self.acquire(exclude=tried)
+            if endpoint is None:
+                raise last_error or RuntimeError("没有可用的推理主机")
+            start = time.perf_counter()
+            try:
+                result = func(endpoint.url)
+            except host_errors as e:
+                self.release(endpoint, ok=False)
+                tried.add(endpoint)
+                get_default_metrics().inc("failovers")
+                last_error = e
+                continue
+            except BaseException:
+                self.release(endpoint, ok=None)
+                raise
+            self.release(endpoint, ok=True, latency=time.perf_counter() - start)
+            return result
+
+    def stats(self):
+        """各主机的请求数、失败数、平均延迟和当前状态"""
+        now = time.monotonic()
+        with self._cond:
+            return [
+                {
+                    "url": ep.url,
+                    "requests": ep.requests,
+                    "failures": ep.failures,
+                    "outstanding": ep.outstanding,
+                    "ewma_latency": ep.ewma_latency,
+                    "healthy": ep.healthy(now),
+                }
+                for ep in self.endpoints
+            ]
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_default_pool():
+    """
+    返回各脚本共享的 Ollama 地址池
+    通过环境变量 OLLAMA_HOSTS 配置多个地址（逗号分隔），否则使用 OLLAMA_BASE_URL；
+    OLLAMA_MAX_PER_HOST 设置每台主机的并发上限
+    """
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            hosts = os.environ.get("OLLAMA_HOSTS") or os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+            _default_pool = EndpointPool(
+                [host.strip() for host in hosts.split(",") if host.strip()],
+                max_concurrency=int(os.environ.get("OLLAMA_MAX_PER_HOST", "4")),
+            )
+        return _default_pool
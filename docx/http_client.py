@@ -0,0 +1,129 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_default_metrics
+
+# 这些状态码通常是暂时性的，值得重试
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# 幂等方法在读取超时后可以安全重发；POST 读取超时时服务端可能仍在处理（如生成长文本、付费接口），
+# 重发会重复执行，因此只在连接阶段失败（请求没有发出去）时重试
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class HttpClient:
+    """
+    各脚本共享的 HTTP 客户端：连接池与长连接、超时、带抖动的指数退避重试、按主机限制并发连接数
+    """
+
+    def __init__(
+        self,
+        connect_timeout=5.0,
+        read_timeout=300.0,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        max_per_host=8,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_per_host = max_per_host
+        self.session = requests.Session()
+        # 重试由本类负责，适配器本身不重试
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max_per_host, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, url):
+        """返回该主机的并发信号量"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    def _backoff(self, attempt, retry_after=None):
+        """计算第 attempt 次重试前的等待时间（全抖动指数退避）"""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def _send(self, method, url, **kwargs):
+        """发送请求并在暂时性错误时重试，返回未关闭的响应"""
+        kwargs.setdefault("timeout", self.timeout)
+        if method.upper() in IDEMPOTENT_METHODS:
+            retry_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+        else:
+            # ConnectTimeout 是 ConnectionError 的子类，ReadTimeout 不是
+            retry_errors = (requests.exceptions.ConnectionError,)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except retry_errors:
+                if attempt >= self.max_retries:
+                    raise
+                get_default_metrics().inc("http_retries")
+                time.sleep(self._backoff(attempt))
+            else:
+                if response.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                    return response
+                delay = self._backoff(attempt, self._retry_after(response))
+                response.close()
+                get_default_metrics().inc("http_retries")
+                time.sleep(delay)
+            attempt += 1
+
+    def request(self, method, url, **kwargs):
+        """发送一次完整的请求，返回响应对象"""
+        with self._slot(url):
+            response = self._send(method, url, **kwargs)
+            # 读完响应体后才释放连接配额
+            response.content
+            return response
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    @contextmanager
+    def stream(self, method, url, **kwargs):
+        """流式请求，在退出上下文前一直占用该主机的连接配额"""
+        with self._slot(url):
+            response = self._send(method, url, stream=True, **kwargs)
+            try:
+                yield response
+            finally:
+                response.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_default_client():
+    """返回各脚本共享的 HTTP 客户端实例"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 缓存模式：
+#   use     - 命中则直接返回，未命中时调用模型并写入缓存（默认）
+#   refresh - 忽略已有缓存，重新调用模型并覆盖缓存
+#   bypass  - 完全不读写缓存
+CACHE_MODES = ("use", "refresh", "bypass")
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_cache.sqlite")
+)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 缓存总大小上限 512 MB
+DEFAULT_MAX_AGE = 30 * 24 * 3600  # 条目最长保留 30 天
+# 每写入这么多次才按存活时间淘汰一次，并重新统计总大小（其他进程也可能写入同一个缓存文件）
+EVICT_EVERY = 100
+
+
+class CompletionCache:
+    """
+    基于 SQLite 的 LLM 回答缓存，键为 (模型, 提示词, 生成参数) 的哈希
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE, mode="use"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"未知的缓存模式：{mode}，可选值为 {CACHE_MODES}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total = 0  # 缓存总大小的累计值，避免每次写入都对整张表求和
+        self._writes = 0
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON completions(accessed)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_created ON completions(created)")
+            self._conn.commit()
+            self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def make_key(model, prompt, params=None):
+        """根据模型、提示词和生成参数计算缓存键"""
+        raw = json.dumps(
+            {"model": model, "prompt": prompt, "params": params or {}},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """读取缓存，未命中或已过期时返回 None"""
+        if self.mode != "use":
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            conn.execute("UPDATE completions SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        """写入缓存并按需淘汰旧条目"""
+        if self.mode == "bypass" or value is None:
+            return
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            conn = self._connect()
+            old = conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            conn.commit()
+            self._total += size - (old[0] if old else 0)
+            self._writes += 1
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        """
+        定期按存活时间淘汰（created 上有索引），再按最近访问时间淘汰直到总大小低于上限
+        总大小用累计值判断，只在定期淘汰时对整张表求和校准一次
+        """
+        if self._writes % EVICT_EVERY == 0:
+            if self.max_age:
+                conn.execute("DELETE FROM completions WHERE created < ?", (now - self.max_age,))
+            self._total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if self.max_bytes and self._total > self.max_bytes:
+            freed = 0
+            stale = []
+            for key, size in conn.execute("SELECT key, size FROM completions ORDER BY accessed"):
+                if self._total - freed <= self.max_bytes:
+                    break
+                stale.append((key,))
+                freed += size
+            conn.executemany("DELETE FROM completions WHERE key = ?", stale)
+            self._total -= freed
+        conn.commit()
+
+    def cached(self, model, prompt, compute, params=None):
+        """
+        带缓存地获取回答
+        参数:
+            compute: 未命中时调用的函数，返回 None 表示失败，不写入缓存
+        """
+        key = self.make_key(model, prompt, params)
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def stats(self):
+        """返回命中/未命中次数及缓存占用"""
+        with self._lock:
+            count, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": size}
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM completions")
+            conn.commit()
+            self._total = 0
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    返回各脚本共享的缓存实例
+    可通过环境变量 LLM_CACHE_MODE=use/refresh/bypass 切换缓存模式
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = CompletionCache(mode=os.environ.get("LLM_CACHE_MODE", "use"))
+        return _default_cache
@@ -0,0 +1,183 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，峰值内存记为 None
+    resource = None
+
+
+def peak_memory_bytes():
+    """进程的峰值常驻内存（字节），无法获取时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RunMetrics:
+    """
+    一次生成任务的性能统计：各阶段耗时、各章节耗时、token 数与生成速度、缓存命中和重试次数、峰值内存
+    只在内存中累加数字，任务结束时导出 JSON 报告和 Prometheus 文本格式文件
+    """
+
+    def __init__(self, name="docgen"):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stages = {}  # 阶段名 -> {"seconds", "count", "max"}
+            self.sections = []
+            self.counters = Counter()
+            self.tokens = {"calls": 0, "prompt": 0, "completion": 0, "prefill_seconds": 0.0, "decode_seconds": 0.0}
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "count": 0, "max": 0.0})
+            stage["seconds"] += seconds
+            stage["count"] += 1
+            stage["max"] = max(stage["max"], seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """统计代码块耗时，同名阶段多次进入时累加"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def record_section(self, title, seconds, **fields):
+        """记录单个章节的耗时及其他字段（如层级、token 数）"""
+        with self._lock:
+            self.sections.append(dict(title=title, seconds=seconds, **fields))
+
+    def record_llm(self, data):
+        """
+        记录一次模型调用的 token 统计
+        参数:
+            data: stream_generate 写入的 stats，或 Ollama 响应中的 prompt_eval_count / eval_count 等字段，
+                  或 OpenAI 兼容接口的 usage
+        """
+        if not data:
+            return
+        prompt = data.get("prompt_tokens", data.get("prompt_eval_count")) or 0
+        completion = data.get("completion_tokens", data.get("eval_count")) or 0
+        prefill = data.get("prefill_time")
+        if prefill is None and data.get("prompt_eval_duration"):
+            prefill = data["prompt_eval_duration"] / 1e9
+        decode = data.get("decode_time")
+        if decode is None and data.get("eval_duration"):
+            decode = data["eval_duration"] / 1e9
+        with self._lock:
+            self.tokens["calls"] += 1
+            self.tokens["prompt"] += prompt
+            self.tokens["completion"] += completion
+            self.tokens["prefill_seconds"] += prefill or 0.0
+            self.tokens["decode_seconds"] += decode or 0.0
+
+    def inc(self, name, value=1):
+        """累加计数器，如 http_retries、failovers"""
+        with self._lock:
+            self.counters[name] += value
+
+    def report(self):
+        """汇总为可序列化的字典"""
+        from llm_cache import get_default_cache
+
+        cache = get_default_cache()
+        with self._lock:
+            decode = self.tokens["decode_seconds"]
+            return {
+                "name": self.name,
+                "started": self.started,
+                "wall_seconds": time.time() - self.started,
+                "peak_memory_bytes": peak_memory_bytes(),
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "tokens": dict(self.tokens, tokens_per_sec=self.tokens["completion"] / decode if decode else None),
+                "cache": {"hits": cache.hits, "misses": cache.misses},
+                "counters": dict(self.counters),
+                "sections": list(self.sections),
+            }
+
+    def to_prometheus(self, report=None):
+        """按 Prometheus 文本格式输出指标，可供 node_exporter 的 textfile collector 采集"""
+        report = report or self.report()
+        prefix = self.name
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_label(val)}"' for key, val in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+        stages = report["stages"]
+        metric("stage_seconds", "gauge", "各阶段累计耗时（秒）",
+               [({"stage": name}, stage["seconds"]) for name, stage in stages.items()])
+        metric("stage_calls", "gauge", "各阶段执行次数",
+               [({"stage": name}, stage["count"]) for name, stage in stages.items()])
+        seconds = [section["seconds"] for section in report["sections"]]
+        metric("section_seconds_sum", "gauge", "章节耗时合计（秒）", [({}, sum(seconds))])
+        metric("section_seconds_max", "gauge", "最慢章节耗时（秒）", [({}, max(seconds, default=0.0))])
+        metric("sections", "gauge", "已处理的章节数", [({}, len(seconds))])
+        tokens = report["tokens"]
+        metric("llm_calls_total", "counter", "模型调用次数", [({}, tokens["calls"])])
+        metric("tokens_total", "counter", "token 数",
+               [({"kind": "prompt"}, tokens["prompt"]), ({"kind": "completion"}, tokens["completion"])])
+        metric("llm_seconds_total", "counter", "模型 prompt 处理与解码耗时（秒）",
+               [({"phase": "prefill"}, tokens["prefill_seconds"]), ({"phase": "decode"}, tokens["decode_seconds"])])
+        if tokens["tokens_per_sec"] is not None:
+            metric("tokens_per_second", "gauge", "平均解码速度", [({}, tokens["tokens_per_sec"])])
+        metric("cache_requests_total", "counter", "LLM 缓存查询次数",
+               [({"result": "hit"}, report["cache"]["hits"]), ({"result": "miss"}, report["cache"]["misses"])])
+        if report["counters"]:
+            metric("events_total", "counter", "重试、故障切换等事件次数",
+                   [({"event": name}, value) for name, value in report["counters"].items()])
+        if report["peak_memory_bytes"] is not None:
+            metric("peak_memory_bytes", "gauge", "进程峰值常驻内存（字节）", [({}, report["peak_memory_bytes"])])
+        metric("wall_seconds", "gauge", "任务总耗时（秒）", [({}, report["wall_seconds"])])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path_prefix):
+        """
+        写出 <path_prefix>.metrics.json 和 <path_prefix>.prom
+        返回：(JSON 报告路径, Prometheus 文件路径)
+        """
+        report = self.report()
+        json_path, prom_path = f"{path_prefix}.metrics.json", f"{path_prefix}.prom"
+        directory = os.path.dirname(json_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        with open(prom_path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus(report))
+        return json_path, prom_path
+
+
+_default_metrics = None
+_default_lock = threading.Lock()
+
+
+def get_default_metrics():
+    """返回进程内共享的性能统计实例"""
+    global _default_metrics
+    with _default_lock:
+        if _default_metrics is None:
+            _default_metrics = RunMetrics()
+        return _default_metrics
@@ -0,0 +1,199 @@
+"""
+本地模拟 Ollama 服务，用于基准测试和压力测试
+
+支持 /api/generate（流式与非流式）、/api/completion、/api/embed，以及 GET /stats 查看请求统计
+设置 capacity 后模拟过载：并发超过 capacity 时延迟按比例上升，超过 2 倍 capacity 时返回 503
+用法：python docx/mock_ollama_server.py [--port 11500] [--latency 0.2] [--tokens-per-sec 50] [--error-rate 0.0] [--capacity 4]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prompt_budget import estimate_tokens
+
+# /api/embed 返回的向量维度
+EMBED_DIM = 64
+# 模拟回答所用的词表
+_WORDS = ["本项目", "采用", "先进的", "技术方案", "确保", "质量", "进度", "安全", "满足", "招标文件", "要求", "。"]
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.2, tokens_per_sec=50.0, error_rate=0.0, completion_tokens=64, capacity=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency  # 首字前的延迟（模拟 prefill），秒
+        self.tokens_per_sec = tokens_per_sec  # 解码速度，0 表示不限速
+        self.error_rate = error_rate  # 以该概率返回 503
+        self.completion_tokens = completion_tokens  # 每个回答的 token 数
+        self.capacity = capacity  # 可同时处理的请求数，0 表示不限
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def add_stats(self, **delta):
+        with self._lock:
+            for key, value in delta.items():
+                self.stats[key] += value
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            return self.stats["in_flight"]
+
+    def slowdown(self, in_flight):
+        """超过处理能力时，多出的请求需要排队，延迟按并发与能力之比放大"""
+        if not self.capacity:
+            return 1.0
+        return max(1.0, in_flight / self.capacity)
+
+    def start(self):
+        """在后台线程中启动服务，返回自身"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 头部和正文分两次写出，不关闭 Nagle 算法时与客户端的延迟确认叠加，每个请求会多出约 40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        if self.path == "/api/embed":
+            self._embed(payload)
+            return
+        if self.path not in ("/api/generate", "/api/completion"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        in_flight = server.add_stats(requests=1, in_flight=1)
+        try:
+            overloaded = server.capacity and in_flight > 2 * server.capacity
+            if overloaded or random.random() < server.error_rate:
+                server.add_stats(errors=1)
+                self._send_json(503, {"error": "server overloaded"})
+                return
+            prompt_tokens = estimate_tokens(payload.get("prompt", ""))
+            server.add_stats(prompt_tokens=prompt_tokens)
+            slowdown = server.slowdown(in_flight)
+            time.sleep(server.latency * slowdown)
+            if self.path == "/api/generate" and payload.get("stream", True):
+                self._stream(payload, prompt_tokens, slowdown)
+            else:
+                self._complete(payload, prompt_tokens, slowdown)
+        finally:
+            server.add_stats(in_flight=-1)
+
+    def _embed(self, payload):
+        """按字二元组哈希生成确定性的向量，字面相近的文本向量也相近"""
+        texts = payload.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        self.server.add_stats(requests=1)
+        embeddings = []
+        for text in texts:
+            vector = [0.0] * EMBED_DIM
+            for i in range(max(len(text) - 1, 1)):
+                vector[zlib.crc32(text[i:i + 2].encode("utf-8")) % EMBED_DIM] += 1.0
+            embeddings.append(vector)
+        self._send_json(200, {"model": payload.get("model"), "embeddings": embeddings})
+
+    def _completion_count(self, payload):
+        """与 Ollama 一致，options.num_predict 限制生成的 token 数"""
+        limit = (payload.get("options") or {}).get("num_predict")
+        return min(limit, self.server.completion_tokens) if limit and limit > 0 else self.server.completion_tokens
+
+    def _tokens(self, count, slowdown=1.0):
+        server = self.server
+        delay = slowdown / server.tokens_per_sec if server.tokens_per_sec else 0.0
+        for i in range(count):
+            if delay:
+                time.sleep(delay)
+            yield _WORDS[i % len(_WORDS)]
+
+    def _final_stats(self, prompt_tokens, count, start):
+        server = self.server
+        eval_duration = time.perf_counter() - start
+        server.add_stats(completion_tokens=count)
+        return {
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(server.latency * 1e9),
+            "eval_count": count,
+            "eval_duration": int(eval_duration * 1e9),
+        }
+
+    def _complete(self, payload, prompt_tokens, slowdown=1.0):
+        start = time.perf_counter()
+        count = self._completion_count(payload)
+        text = "".join(self._tokens(count, slowdown))
+        data = {"model": payload.get("model"), "response": text, "completion": text}
+        data.update(self._final_stats(prompt_tokens, count, start))
+        self._send_json(200, data)
+
+    def _stream(self, payload, prompt_tokens, slowdown=1.0):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_line(data):
+            line = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+        start = time.perf_counter()
+        count = self._completion_count(payload)
+        for token in self._tokens(count, slowdown):
+            write_line({"model": payload.get("model"), "response": token, "done": False})
+        final = {"model": payload.get("model"), "response": ""}
+        final.update(self._final_stats(prompt_tokens, count, start))
+        write_line(final)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 Ollama 服务")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--capacity", type=int, default=0)
+    args = parser.parse_args()
+    server = MockOllamaServer(
+        args.port, args.latency, args.tokens_per_sec, args.error_rate, args.completion_tokens, args.capacity
+    )
+    print(f"模拟 Ollama 服务已启动：{server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import json
+import os
+import time
+
+import requests
+
+from endpoint_pool import get_default_pool
+from http_client import get_default_client
+from metrics import get_default_metrics
+
+# 可通过环境变量指向其他 Ollama 服务（例如基准测试用的模拟服务器）
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+
+def stream_generate(prompt, model="llama3.2", base_url=None, options=None, stats=None, keep_alive=None):
+    """
+    以流式方式调用 Ollama /api/generate，逐个产出生成的文本片段
+    参数:
+        base_url: Ollama 地址，为 None 时从共享地址池中选择负载最低的主机
+        options: 传给 Ollama 的生成参数，如 num_ctx、num_predict
+        stats: 可选的字典，请求结束后写入 ttft（首字延迟，秒）、tokens_per_sec、
+               prefill_time / decode_time（prompt 处理与解码耗时，秒）等统计
+        keep_alive: 模型在空闲后保持加载的时长，如 "30m"，避免章节之间模型被卸载
+    返回：文本片段的生成器
+    """
+    payload = {"model": model, "prompt": prompt, "stream": True}
+    if options:
+        payload["options"] = options
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    stats = {} if stats is None else stats
+
+    pool = endpoint = None
+    if base_url is None:
+        pool = get_default_pool()
+        endpoint = pool.acquire()
+        base_url = endpoint.url
+
+    start = time.perf_counter()
+    first_token_at = None
+    chunks = 0
+    final = {}
+    completed = failed = False
+    try:
+        with get_default_client().stream("POST", f"{base_url}/api/generate", json=payload) as response:
+            response.raise_for_status()
+            # Ollama 返回 NDJSON，每行一个 JSON 对象，最后一行带 done=true 和统计字段
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(f"Ollama 返回错误：{data['error']}")
+                token = data.get("response", "")
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    chunks += 1
+                    yield token
+                if data.get("done"):
+                    final = data
+                    break
+        completed = True
+    except (requests.RequestException, OSError):
+        failed = True  # 只有连接、超时和 HTTP 错误才算主机故障
+        raise
+    finally:
+        # 调用方提前关闭生成器（GeneratorExit）或 Ollama 返回业务错误时不能说明主机的好坏，只归还名额；
+        # 没有读完的请求不计入延迟统计
+        if pool is not None:
+            ok = False if failed else (True if completed else None)
+            pool.release(endpoint, ok=ok, latency=time.perf_counter() - start if completed else None)
+
+    end = time.perf_counter()
+    stats["model"] = model
+    stats["total_time"] = end - start
+    stats["ttft"] = (first_token_at - start) if first_token_at is not None else None
+    # 优先使用 Ollama 自带的统计（纳秒），否则按收到的片段数估算
+    eval_count = final.get("eval_count", chunks)
+    eval_duration = final.get("eval_duration")
+    if eval_duration:
+        decode_time = eval_duration / 1e9
+    elif first_token_at is not None:
+        decode_time = end - first_token_at
+    else:
+        decode_time = 0.0
+    stats["completion_tokens"] = eval_count
+    stats["prompt_tokens"] = final.get("prompt_eval_count")
+    # prompt_eval_count 明显小于 prompt 长度时，说明前缀命中了 Ollama 的 KV 缓存
+    stats["prefill_time"] = final.get("prompt_eval_duration", 0) / 1e9 if "prompt_eval_duration" in final else None
+    stats["decode_time"] = decode_time
+    stats["tokens_per_sec"] = (eval_count / decode_time) if decode_time > 0 else None
+    get_default_metrics().record_llm(stats)
+
+
+def response_stats(data, model, total_time):
+    """
+    把非流式响应中的统计字段（纳秒）换算成与 stream_generate 相同的 stats
+    非流式请求在客户端看不到首个片段的到达时间，ttft 取服务端解码开始前的耗时（加载 + prompt 处理）
+    """
+    decode_time = data["eval_duration"] / 1e9 if data.get("eval_duration") else None
+    if data.get("total_duration"):
+        ttft = (data["total_duration"] - data.get("eval_duration", 0)) / 1e9
+    elif "prompt_eval_duration" in data:
+        ttft = (data.get("load_duration", 0) + data["prompt_eval_duration"]) / 1e9
+    else:
+        ttft = None
+    eval_count = data.get("eval_count")
+    return {
+        "model": model,
+        "total_time": total_time,
+        "ttft": ttft,
+        "completion_tokens": eval_count,
+        "prompt_tokens": data.get("prompt_eval_count"),
+        "prefill_time": data["prompt_eval_duration"] / 1e9 if "prompt_eval_duration" in data else None,
+        "decode_time": decode_time,
+        "tokens_per_sec": eval_count / decode_time if eval_count and decode_time else None,
+    }
+
+
+def generate(prompt, model="llama3.2", base_url=None, options=None, stats=None, keep_alive=None):
+    """
+    流式调用 Ollama 并返回完整回答
+    base_url 为 None 时经共享地址池调度，某台主机失败会切换到其他主机重新生成
+    """
+    if base_url is not None:
+        return "".join(stream_generate(prompt, model, base_url, options, stats, keep_alive))
+    return get_default_pool().call(
+        lambda url: "".join(stream_generate(prompt, model, url, options, stats, keep_alive))
+    )
+
+
+def embed(texts, model="nomic-embed-text", base_url=None, batch_size=64):
+    """
+    调用 Ollama /api/embed 批量计算向量，每个请求最多 batch_size 条文本
+    返回：与 texts 一一对应的向量列表
+    """
+
+    def post(url, batch):
+        response = get_default_client().post(f"{url}/api/embed", json={"model": model, "input": batch})
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        batch = list(texts[start:start + batch_size])
+        if base_url is not None:
+            vectors.extend(post(base_url, batch))
+        else:
+            vectors.extend(get_default_pool().call(lambda url: post(url, batch)))
+    return vectors
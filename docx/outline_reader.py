@@ -0,0 +1,126 @@
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W = "{%s}" % W_NS
+
+_HEADING_NAME_RE = re.compile(r"^heading\s+(\d+)$", re.IGNORECASE)
+
+
+def _val(elem, child):
+    """读取子元素的 w:val 属性"""
+    node = elem.find(W + child)
+    return node.get(W + "val") if node is not None else None
+
+
+def read_heading_styles(docx_zip):
+    """
+    解析 styles.xml，得到 段落样式ID -> 标题级别 的映射
+    级别优先由内置样式名 "heading N" 决定，其次取样式（含继承）的大纲级别 outlineLvl
+    返回：(映射字典, 默认段落样式ID)
+    """
+    styles = {}
+    default_style = None
+    try:
+        data = docx_zip.open("word/styles.xml")
+    except KeyError:
+        return {}, None
+    with data:
+        for _, elem in ET.iterparse(data):
+            if elem.tag != W + "style" or elem.get(W + "type") != "paragraph":
+                continue
+            style_id = elem.get(W + "styleId")
+            ppr = elem.find(W + "pPr")
+            styles[style_id] = (
+                _val(elem, "name") or "",
+                _val(elem, "basedOn"),
+                _val(ppr, "outlineLvl") if ppr is not None else None,
+            )
+            if elem.get(W + "default") in ("1", "true", "on"):
+                default_style = style_id
+            elem.clear()
+
+    def resolve(style_id, seen=()):
+        name, based_on, outline_level = styles.get(style_id, ("", None, None))
+        match = _HEADING_NAME_RE.match(name)
+        if match:
+            return int(match.group(1))
+        if outline_level is not None:
+            level = int(outline_level) + 1
+            return level if level <= 9 else None  # outlineLvl 9 表示正文
+        if based_on and based_on not in seen:
+            return resolve(based_on, seen + (style_id,))
+        return None
+
+    levels = {}
+    for style_id in styles:
+        level = resolve(style_id)
+        if level is not None:
+            levels[style_id] = level
+    return levels, default_style
+
+
+def _paragraph_text(paragraph):
+    """按 python-docx 的规则拼接段落文本（包含超链接中的文字）"""
+    parts = []
+    runs = []
+    for child in paragraph:
+        if child.tag == W + "r":
+            runs.append(child)
+        elif child.tag == W + "hyperlink":
+            runs.extend(child.findall(W + "r"))
+    for run in runs:
+        for node in run:
+            if node.tag == W + "t":
+                parts.append(node.text or "")
+            elif node.tag in (W + "tab", W + "ptab"):
+                parts.append("\t")
+            elif node.tag == W + "cr" or (node.tag == W + "br" and node.get(W + "type", "textWrapping") == "textWrapping"):
+                parts.append("\n")
+            elif node.tag == W + "noBreakHyphen":
+                parts.append("-")
+    return "".join(parts)
+
+
+def iter_paragraphs(docx_path):
+    """
+    直接从 docx 压缩包中流式解析 word/document.xml，逐个产出 (level, text)，非标题段落的 level 为 None
+    只处理正文中的顶层段落（与 python-docx 的 document.paragraphs 一致），处理完即释放元素
+    """
+    with zipfile.ZipFile(docx_path) as docx_zip:
+        levels, default_style = read_heading_styles(docx_zip)
+        with docx_zip.open("word/document.xml") as data:
+            depth = 0
+            body = None
+            body_depth = None
+            for event, elem in ET.iterparse(data, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if body is None and elem.tag == W + "body":
+                        body, body_depth = elem, depth
+                    continue
+                depth -= 1
+                if body is None or depth != body_depth:
+                    continue
+                # 到这里 elem 是 w:body 的直接子元素，且已完整解析
+                if elem.tag == W + "p":
+                    ppr = elem.find(W + "pPr")
+                    style_id = _val(ppr, "pStyle") if ppr is not None else None
+                    yield levels.get(style_id or default_style), _paragraph_text(elem)
+                body.clear()  # 释放已处理的顶层元素
+
+
+def iter_outline(docx_path):
+    """流式产出文档中的标题 (level, title)"""
+    for level, text in iter_paragraphs(docx_path):
+        if level is not None:
+            yield level, text.strip()
+
+
+def read_outline(docx_path):
+    """
+    从 docx 文件中读取目录大纲
+    返回：包含章节标题及其级别的列表 [(level, title)]
+    """
+    return list(iter_outline(docx_path))
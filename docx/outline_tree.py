@@ -0,0 +1,92 @@
+import re
+
+# 标题末尾的字数要求，例如 "项目概述(3000)"、"项目概述（约3000字）"
+_WORD_COUNT_RE = re.compile(r"[(（]\s*约?\s*(\d+)\s*字?\s*[)）]\s*$")
+
+
+def parse_word_count(title):
+    """
+    解析标题末尾的字数要求
+    返回：(去掉字数要求的标题, 字数)，没有字数要求时字数为 None
+    """
+    match = _WORD_COUNT_RE.search(title)
+    if not match:
+        return title, None
+    return title[: match.start()].rstrip(), int(match.group(1))
+
+
+class OutlineNode:
+    """
+    大纲树节点：用 __slots__ 压缩内存，子节点以 首子节点/兄弟节点 链表串联，不为每个节点分配列表
+    """
+
+    __slots__ = ("level", "title", "word_count", "content", "parent", "first_child", "last_child", "next_sibling")
+
+    def __init__(self, level, title, word_count=None):
+        self.level = level
+        self.title = title
+        self.word_count = word_count
+        self.content = ""
+        self.parent = None
+        self.first_child = None
+        self.last_child = None
+        self.next_sibling = None
+
+    def add_child(self, node):
+        """在末尾追加子节点，O(1)"""
+        node.parent = self
+        if self.last_child is None:
+            self.first_child = node
+        else:
+            self.last_child.next_sibling = node
+        self.last_child = node
+        return node
+
+    def children(self):
+        """按顺序遍历直接子节点"""
+        node = self.first_child
+        while node is not None:
+            yield node
+            node = node.next_sibling
+
+    def __repr__(self):
+        return f"OutlineNode(level={self.level}, title={self.title!r})"
+
+
+def build_outline_tree(headings, root_title="Document Title"):
+    """
+    由 [(level, title)] 单次遍历构建大纲树，层级不限
+    标题挂在最近的、级别比它小的标题下面；级别跳跃（如 1 直接到 3）也能正确处理
+    返回：级别为 0 的根节点
+    """
+    root = OutlineNode(0, root_title)
+    stack = [root]
+    for level, title in headings:
+        while stack[-1].level >= level and len(stack) > 1:
+            stack.pop()
+        # 字数要求只保存在 word_count 中，标题本身不带 "(N)"，避免进入提示词、缓存键和写出的标题
+        title, word_count = parse_word_count(title)
+        node = OutlineNode(level, title, word_count)
+        stack[-1].add_child(node)
+        stack.append(node)
+    return root
+
+
+def walk(root):
+    """先序遍历（不含根节点），即文档中标题出现的顺序"""
+    stack = list(reversed(list(root.children())))
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(node.children())))
+
+
+def iter_levels(root):
+    """
+    按树的深度逐层产出节点列表，便于把同一层的标题一起调度
+    下一层在上一层被处理完之后才收集，处理过程中新挂上的子节点同样会被遍历到
+    """
+    current = list(root.children())
+    while current:
+        yield current
+        current = [child for node in current for child in node.children()]
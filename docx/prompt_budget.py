@@ -0,0 +1,99 @@
+import math
+import re
+
+_CJK_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿　-〿＀-￯]")
+
+# 经验系数：Llama 3 系列分词器下，常用汉字及中文标点平均约 1.3 个 token，
+# 其余字符（英文、数字、空白）平均约 4 个字符 1 个 token
+CJK_TOKENS_PER_CHAR = 1.3
+OTHER_CHARS_PER_TOKEN = 4.0
+
+# 各模型每次请求使用的上下文长度（num_ctx）。
+# 同一模型应保持固定：Ollama 在 num_ctx 变化时会重新加载模型
+MODEL_NUM_CTX = {
+    "llama2": 4096,
+    "llama3.2": 8192,
+}
+DEFAULT_NUM_CTX = 4096
+DEFAULT_WORD_COUNT = 1000
+
+# 为模板中的系统提示、分隔符等预留的 token
+SAFETY_MARGIN = 64
+
+
+def estimate_tokens(text):
+    """按中文/非中文字符分别估算 token 数，无需加载分词器"""
+    cjk = len(_CJK_RE.findall(text))
+    other = len(text) - cjk
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + other / OTHER_CHARS_PER_TOKEN)
+
+
+def num_ctx_for(model):
+    """返回模型的上下文预算"""
+    return MODEL_NUM_CTX.get(model, DEFAULT_NUM_CTX)
+
+
+def num_predict_for(word_count):
+    """根据章节字数要求估算需要生成的 token 数，多留 20% 余量"""
+    return math.ceil((word_count or DEFAULT_WORD_COUNT) * CJK_TOKENS_PER_CHAR * 1.2)
+
+
+def generation_options(model, word_count=None, num_ctx=None):
+    """返回请求参数 options：模型的上下文预算 num_ctx 和按字数估算的生成长度 num_predict"""
+    num_ctx = num_ctx or num_ctx_for(model)
+    return {"num_ctx": num_ctx, "num_predict": min(num_predict_for(word_count), num_ctx // 2)}
+
+
+def pack_references(references, budget):
+    """
+    按优先级顺序装入参考资料，直到 token 预算用完；放不下的条目跳过，后面更短的条目仍可装入
+    返回：(保留的参考资料列表, 丢弃条数, 丢弃的 token 数)
+    """
+    kept = []
+    used = 0
+    dropped = 0
+    dropped_tokens = 0
+    for reference in references:
+        cost = estimate_tokens(reference) + 1  # 换行分隔符
+        if used + cost <= budget:
+            kept.append(reference)
+            used += cost
+        else:
+            dropped += 1
+            dropped_tokens += cost
+    return kept, dropped, dropped_tokens
+
+
+def build_section_prompt(render, references, model, word_count=None, max_reference_tokens=None, num_ctx=None):
+    """
+    构建一个章节的 prompt，参考资料不超过模型上下文预算
+    参数:
+        render: 接收参考资料文本、返回完整 prompt 的函数
+        references: 按优先级排列的参考资料列表
+        max_reference_tokens: 参考资料额外的 token 上限，None 表示只受上下文预算限制
+    返回：(prompt, 请求参数 options, 装填报告)
+    """
+    options = generation_options(model, word_count, num_ctx)
+    num_ctx, num_predict = options["num_ctx"], options["num_predict"]
+    base_tokens = estimate_tokens(render(""))
+    budget = max(num_ctx - num_predict - base_tokens - SAFETY_MARGIN, 0)
+    if max_reference_tokens is not None:
+        budget = min(budget, max_reference_tokens)
+
+    kept, dropped, dropped_tokens = pack_references(references, budget)
+    prompt = render("\n".join(kept))
+    report = {
+        "prompt_tokens": estimate_tokens(prompt),
+        "kept": len(kept),
+        "dropped": dropped,
+        "dropped_tokens": dropped_tokens,
+    }
+    return prompt, options, report
+
+
+def format_report(title, report):
+    """把装填报告格式化为一行提示"""
+    return (
+        f"章节 '{title}'：参考资料保留 {report['kept']} 条，"
+        f"丢弃 {report['dropped']} 条（约 {report['dropped_tokens']} tokens），prompt 约 {report['prompt_tokens']} tokens"
+    )
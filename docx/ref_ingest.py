@@ -0,0 +1,234 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from outline_reader import iter_paragraphs
+
+SUPPORTED_EXTENSIONS = (".txt", ".docx", ".doc")
+DEFAULT_INGEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "references")
+
+# 超过该大小的文本文件改用内存映射逐行读取，不把整个文件读入内存
+MMAP_THRESHOLD = 8 * 1024 * 1024
+TEXT_ENCODINGS = ("utf-8", "gb18030")
+
+_SPACE_RE = re.compile(r"[\s　]+")
+
+
+def normalize_paragraph(text):
+    """合并连续空白（含全角空格）并去掉首尾空白"""
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def _decode(data):
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+
+def _iter_text_lines(path):
+    """逐行产出文本文件内容，大文件经内存映射读取"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as file:
+        if size < MMAP_THRESHOLD:
+            yield from _decode(file.read()).splitlines()
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < size:
+                end = data.find(b"\n", start)
+                if end == -1:
+                    end = size
+                yield _decode(data[start:end])
+                start = end + 1
+
+
+def _doc_to_text(path):
+    """旧版 .doc 借助 antiword 或 LibreOffice 转成文本，两者都没有时返回 None"""
+    if shutil.which("antiword"):
+        result = subprocess.run(["antiword", path], capture_output=True, check=True)
+        return _decode(result.stdout)
+    office = shutil.which("soffice") or shutil.which("libreoffice")
+    if office:
+        with tempfile.TemporaryDirectory() as out_dir:
+            subprocess.run(
+                [office, "--headless", "--convert-to", "txt:Text", "--outdir", out_dir, path],
+                capture_output=True, check=True,
+            )
+            name = os.path.splitext(os.path.basename(path))[0] + ".txt"
+            with open(os.path.join(out_dir, name), "rb") as file:
+                return _decode(file.read())
+    return None
+
+
+def iter_reference_paragraphs(path):
+    """
+    按文件格式逐个产出原始段落文本
+    .doc 文件如果实际是 docx 压缩包（常见于改过扩展名的文件）则按 docx 解析
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".txt":
+        yield from _iter_text_lines(path)
+    elif ext == ".docx" or (ext == ".doc" and zipfile.is_zipfile(path)):
+        for _, text in iter_paragraphs(path):
+            yield text
+    elif ext == ".doc":
+        text = _doc_to_text(path)
+        if text is None:
+            raise RuntimeError("解析 .doc 需要安装 antiword 或 LibreOffice")
+        yield from text.splitlines()
+    else:
+        raise ValueError(f"不支持的参考资料格式：{path}")
+
+
+def read_reference_file(path):
+    """读取单个参考资料文件，返回规范化后的非空段落列表"""
+    paragraphs = (normalize_paragraph(text) for text in iter_reference_paragraphs(path))
+    return [text for text in paragraphs if text]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _ingest_file(args):
+    """
+    在工作进程中解析一个文件，段落按内容哈希写入段落库，只把元数据返回给主进程
+    返回：(相对路径, 内容哈希, 段落数, 错误信息)
+    """
+    path, rel_path, para_dir = args
+    try:
+        digest = file_hash(path)
+        target = os.path.join(para_dir, digest + ".json")
+        if os.path.exists(target):  # 内容相同的文件（如副本）只解析一次
+            with open(target, "r", encoding="utf-8") as file:
+                return rel_path, digest, len(json.load(file)), None
+        paragraphs = read_reference_file(path)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(paragraphs, file, ensure_ascii=False)
+        os.replace(tmp, target)
+        return rel_path, digest, len(paragraphs), None
+    except Exception as e:
+        return rel_path, None, 0, f"{type(e).__name__}: {e}"
+
+
+class ParagraphStore:
+    """
+    参考资料文件夹的规范化段落库：
+    - 用进程池并行解析文件夹（含子文件夹）中的 .txt / .docx / .doc 文件
+    - manifest.json 记录每个文件的修改时间、大小和内容哈希，未变化的文件直接跳过
+    - 段落按内容哈希保存在 paragraphs/<哈希>.json 中
+    """
+
+    def __init__(self, folder, store_dir=None, max_workers=None):
+        """
+        参数:
+            folder: 参考资料文件夹
+            store_dir: 段落库目录，默认按文件夹路径放在 .cache/references 下
+            max_workers: 解析进程数，默认等于 CPU 核数
+        """
+        self.folder = os.path.abspath(folder)
+        if store_dir is None:
+            folder_id = hashlib.sha1(self.folder.encode("utf-8")).hexdigest()[:16]
+            store_dir = os.path.join(DEFAULT_INGEST_DIR, folder_id)
+        self.store_dir = store_dir
+        self.para_dir = os.path.join(store_dir, "paragraphs")
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.manifest_path = os.path.join(store_dir, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                self.manifest = json.load(file)
+
+    def scan(self):
+        """列出文件夹中所有支持的文件，返回 {相对路径: (修改时间, 大小)}"""
+        files = {}
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if name.startswith("~$") or not name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    continue  # 跳过 Word 打开文件时产生的锁文件
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files[os.path.relpath(path, self.folder)] = (stat.st_mtime, stat.st_size)
+        return files
+
+    def update(self):
+        """
+        增量更新段落库
+        返回：{"parsed": 本次解析的文件数, "skipped": 未变化跳过的文件数, "removed": 已删除的文件数, "failed": [...]}
+        """
+        files = self.scan()
+        changed = [
+            rel_path for rel_path, (mtime, size) in files.items()
+            if self.manifest.get(rel_path, {}).get("mtime") != mtime or self.manifest.get(rel_path, {}).get("size") != size
+        ]
+        removed = [rel_path for rel_path in self.manifest if rel_path not in files]
+        for rel_path in removed:
+            del self.manifest[rel_path]
+
+        failed = []
+        if changed:
+            os.makedirs(self.para_dir, exist_ok=True)
+            jobs = [(os.path.join(self.folder, rel_path), rel_path, self.para_dir) for rel_path in changed]
+            if self.max_workers > 1 and len(jobs) > 1:
+                # 大量小文件时按批分发，减少进程间通信次数
+                chunksize = max(1, len(jobs) // (self.max_workers * 4))
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    results = list(executor.map(_ingest_file, jobs, chunksize=chunksize))
+            else:
+                results = [_ingest_file(job) for job in jobs]
+            for rel_path, digest, count, error in results:
+                if error is not None:
+                    failed.append((rel_path, error))
+                    self.manifest.pop(rel_path, None)
+                    continue
+                mtime, size = files[rel_path]
+                self.manifest[rel_path] = {"mtime": mtime, "size": size, "hash": digest, "paragraphs": count}
+
+        if changed or removed:
+            self._save_manifest()
+            self._remove_orphans()
+        for rel_path, error in failed:
+            print(f"警告：参考资料 {rel_path} 解析失败：{error}")
+        return {"parsed": len(changed) - len(failed), "skipped": len(files) - len(changed), "removed": len(removed),
+                "failed": failed}
+
+    def _save_manifest(self):
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, ensure_ascii=False)
+        os.replace(tmp, self.manifest_path)
+
+    def _remove_orphans(self):
+        """删除已不被任何文件引用的段落文件"""
+        referenced = {entry["hash"] + ".json" for entry in self.manifest.values()}
+        for name in os.listdir(self.para_dir) if os.path.isdir(self.para_dir) else []:
+            if name.endswith(".json") and name not in referenced:
+                os.remove(os.path.join(self.para_dir, name))
+
+    def paragraphs(self, rel_path):
+        """读取一个文件的段落列表"""
+        digest = self.manifest[rel_path]["hash"]
+        with open(os.path.join(self.para_dir, digest + ".json"), "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def load(self):
+        """读取全部文件的段落，返回 {相对路径: 段落列表}，按路径排序"""
+        return {rel_path: self.paragraphs(rel_path) for rel_path in sorted(self.manifest)}
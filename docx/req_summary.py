@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from outline_reader import iter_paragraphs
+from prompt_budget import estimate_tokens, pack_references
+
+DEFAULT_SUMMARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "summaries")
+
+# 单次摘要请求输入的 token 上限，超过时先切块分别摘要
+CHUNK_TOKENS = 2000
+
+
+class SummaryNode:
+    """需求文件的章节节点：原文段落、本节摘要（含子章节）和子章节"""
+
+    __slots__ = ("level", "title", "paragraphs", "summary", "children")
+
+    def __init__(self, level, title):
+        self.level = level
+        self.title = title
+        self.paragraphs = []
+        self.summary = ""
+        self.children = []
+
+    def to_dict(self):
+        return {
+            "level": self.level,
+            "title": self.title,
+            "summary": self.summary,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        node = cls(data["level"], data["title"])
+        node.summary = data["summary"]
+        node.children = [cls.from_dict(child) for child in data["children"]]
+        return node
+
+
+def read_requirement_tree(req_docx_path):
+    """按需求文件自身的标题把正文切分成章节树，返回级别为 0 的根节点"""
+    root = SummaryNode(0, os.path.basename(req_docx_path))
+    stack = [root]
+    for level, text in iter_paragraphs(req_docx_path):
+        text = text.strip()
+        if not text:
+            continue
+        if level is None:
+            stack[-1].paragraphs.append(text)
+            continue
+        while stack[-1].level >= level and len(stack) > 1:
+            stack.pop()
+        node = SummaryNode(level, text)
+        stack[-1].children.append(node)
+        stack.append(node)
+    return root
+
+
+def _chunks(paragraphs, chunk_tokens=CHUNK_TOKENS):
+    """把段落按 token 上限切块"""
+    chunk, used = [], 0
+    for paragraph in paragraphs:
+        cost = estimate_tokens(paragraph)
+        if chunk and used + cost > chunk_tokens:
+            yield "\n".join(chunk)
+            chunk, used = [], 0
+        chunk.append(paragraph)
+        used += cost
+    if chunk:
+        yield "\n".join(chunk)
+
+
+def _summary_prompt(title, text):
+    return f"请用简洁的中文概括招标文件中“{title}”部分的要点，保留数字、日期和硬性要求：\n{text}"
+
+
+class RequirementSummarizer:
+    """
+    需求文件的分层摘要（map-reduce）：
+    map 阶段并发摘要各章节正文的分块，reduce 阶段自底向上把子章节摘要合并成父章节摘要。
+    结果按文件内容哈希缓存，需求文件不变时后续运行直接复用
+    """
+
+    def __init__(self, summarize, model="", max_workers=4, cache_dir=DEFAULT_SUMMARY_DIR):
+        """
+        参数:
+            summarize: 接收 prompt、返回摘要文本的函数，例如 ask_ollama
+            model: 模型名称，参与缓存键计算
+        """
+        self.summarize = summarize
+        self.model = model
+        self.max_workers = max_workers
+        self.cache_dir = cache_dir
+        self._failures = 0
+        self._lock = threading.Lock()  # _summarize 在线程池中并发执行
+
+    def _summarize(self, prompt):
+        """调用模型摘要，记录失败次数；有失败时本次结果不写入缓存"""
+        summary = self.summarize(prompt)
+        if not summary:
+            with self._lock:
+                self._failures += 1
+        return summary
+
+    def _cache_path(self, req_docx_path):
+        digest = hashlib.sha256()
+        with open(req_docx_path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(self.model.encode("utf-8"))
+        return os.path.join(self.cache_dir, digest.hexdigest() + ".json")
+
+    def build(self, req_docx_path):
+        """构建（或从缓存读取）需求文件的摘要树"""
+        cache_path = self._cache_path(req_docx_path)
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as file:
+                return SummaryNode.from_dict(json.load(file))
+
+        root = read_requirement_tree(req_docx_path)
+        self._failures = 0
+        nodes_by_depth = []
+        current = [root]
+        while current:
+            nodes_by_depth.append(current)
+            current = [child for node in current for child in node.children]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # map：所有章节正文分块一次性并发摘要
+            jobs = [(node, chunk) for depth in nodes_by_depth for node in depth for chunk in _chunks(node.paragraphs)]
+            summaries = executor.map(lambda job: self._summarize(_summary_prompt(job[0].title, job[1])), jobs)
+            chunk_summaries = {}
+            for (node, _), summary in zip(jobs, summaries):
+                chunk_summaries.setdefault(id(node), []).append(summary or "")
+
+            # reduce：从最深层开始，同一层的章节并发合并
+            for depth in reversed(nodes_by_depth):
+                parts = [
+                    chunk_summaries.get(id(node), []) + [f"{child.title}：{child.summary}" for child in node.children]
+                    for node in depth
+                ]
+                for node, merged in zip(depth, executor.map(self._reduce, depth, parts)):
+                    node.summary = merged
+
+        if self._failures:
+            print(f"有 {self._failures} 次摘要请求失败，本次摘要不写入缓存")
+            return root
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as file:
+            json.dump(root.to_dict(), file, ensure_ascii=False)
+        return root
+
+    def _reduce(self, node, parts):
+        """合并一个章节的各部分摘要；只有一部分或足够短时直接拼接，不再调用模型"""
+        parts = [part for part in parts if part]
+        if not parts:
+            return ""
+        text = "\n".join(parts)
+        if len(parts) == 1 or estimate_tokens(text) <= CHUNK_TOKENS // 4:
+            return text
+        # 过长时先逐块摘要再合并，最多压缩几轮，防止模型输出不收敛
+        for _ in range(3):
+            if estimate_tokens(text) <= CHUNK_TOKENS:
+                break
+            text = "\n".join(self._summarize(_summary_prompt(node.title, chunk)) or "" for chunk in _chunks(parts))
+            parts = text.splitlines()
+        return self._summarize(_summary_prompt(node.title, text)) or text
+
+
+def summary_digest(root, max_tokens=800):
+    """
+    生成文档级摘要：按层级从上到下依次装入各章节摘要，直到 token 预算用完
+    返回：摘要文本
+    """
+    entries = []
+    current = root.children or [root]
+    while current:
+        entries.extend(f"{node.title}：{node.summary}" for node in current if node.summary)
+        current = [child for node in current for child in node.children]
+    return "\n".join(pack_references(entries, max_tokens)[0])
@@ -0,0 +1,68 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+# 连续的中日韩字符，或由字母数字组成的单词
+_TOKEN_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[A-Za-z0-9]+")
+_CJK_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+
+def tokenize(text):
+    """
+    中文感知的分词：中文按字二元组切分，英文和数字按单词切分
+    返回：词项列表
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall(text):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+class RequirementIndex:
+    """
+    基于 BM25 的需求段落倒排索引，只需构建一次，可供所有标题检索
+    """
+
+    def __init__(self, paragraphs, k1=1.5, b=0.75):
+        self.paragraphs = list(paragraphs)
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # 词项 -> [(段落序号, 词频)]
+        self.doc_lengths = []
+        for doc_id, paragraph in enumerate(self.paragraphs):
+            counts = Counter(tokenize(paragraph))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((doc_id, tf))
+        total = len(self.paragraphs)
+        self.avg_length = (sum(self.doc_lengths) / total) if total else 0.0
+        self.idf = {
+            term: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query, top_k=5):
+        """
+        检索与查询最相关的段落
+        返回：[(段落序号, 得分)]，按得分从高到低排列
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
+
+    def top_paragraphs(self, query, top_k=5):
+        """返回前 top_k 个相关段落，按相关度从高到低排列"""
+        return [self.paragraphs[doc_id] for doc_id, _ in self.search(query, top_k)]
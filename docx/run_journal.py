@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def section_key(*parts):
+    """根据章节的层级、标题、上下文等内容计算哈希，内容不变则哈希不变"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RunJournal:
+    """
+    生成过程的运行日志（JSON Lines，只追加）
+    每完成一个章节就写入一行 {pos, key, level, title, answer}，进程中断后可从日志恢复；
+    大纲变化后重新运行时，只有新增或内容变化的章节需要重新生成
+    内存中只保存内容哈希到行首偏移量的映射，回答在需要时从文件中读取，内存占用不随文档长度增长
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}  # 内容哈希 -> 日志行在文件中的字节偏移量
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        end = 0  # 最后一个完整行的结束位置
+        with open(self.path, "rb") as file:
+            for line in file:
+                offset, end = end, end + len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断时最后一行可能没有写完整
+                    end = offset
+                    continue
+                self.offsets[entry["key"]] = offset
+        if end < os.path.getsize(self.path):
+            # 截掉没有写完整的尾行，否则下一次追加会接在它后面
+            with open(self.path, "r+b") as file:
+                file.truncate(end)
+
+    def _read(self, file, key):
+        file.seek(self.offsets[key])
+        return json.loads(file.readline())
+
+    def lookup(self, key):
+        """返回已完成章节的内容，没有记录时返回 None"""
+        with self._lock:
+            if key not in self.offsets:
+                return None
+            with open(self.path, "rb") as file:
+                return self._read(file, key)["answer"]
+
+    def diff(self, keys):
+        """
+        将本次大纲与日志中的记录对比
+        返回：(可复用的位置列表, 需要生成的位置列表, 已不在大纲中的旧记录数)
+        """
+        reused = [pos for pos, key in enumerate(keys) if key in self.offsets]
+        pending = [pos for pos, key in enumerate(keys) if key not in self.offsets]
+        removed = len(set(self.offsets) - set(keys))
+        return reused, pending, removed
+
+    def record(self, pos, key, level, title, answer):
+        """记录一个已完成的章节，立即落盘"""
+        entry = {"pos": pos, "key": key, "level": level, "title": title, "answer": answer}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as file:
+                offset = file.tell()
+                file.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+                file.flush()
+                os.fsync(file.fileno())
+            self.offsets[key] = offset
+
+    def compact(self, keys):
+        """运行结束后只保留当前大纲中的章节，避免日志无限增长；逐条从旧日志复制，不把回答全部读入内存"""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            offsets = {}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as out:
+                if self.offsets:
+                    with open(self.path, "rb") as file:
+                        for pos, key in enumerate(keys):
+                            if key not in self.offsets or key in offsets:
+                                continue
+                            entry = dict(self._read(file, key), pos=pos)
+                            offsets[key] = out.tell()
+                            out.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            os.replace(tmp_path, self.path)
+            self.offsets = offsets
@@ -0,0 +1,227 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from adaptive_limiter import get_default_limiter
+from llm_cache import get_default_cache
+
+
+class ServerBusy(Exception):
+    """请求队列已满，需要客户端稍后重试"""
+
+
+class Flight:
+    """
+    一次正在进行（或已完成）的生成，可被多个请求同时订阅：
+    相同问题的后续请求不再调用模型，而是从头重放已生成的片段并继续等待后续片段
+    """
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.created = time.perf_counter()
+        self._cond = threading.Condition()
+
+    def append(self, text):
+        with self._cond:
+            self.chunks.append(text)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def __iter__(self):
+        """逐个产出生成的文本片段，生成失败时抛出原始异常"""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                pending = self.chunks[index:]
+                finished = self.done
+            yield from pending
+            index += len(pending)
+            if finished and index >= len(self.chunks):
+                break
+        if self.error is not None:
+            raise self.error
+
+    def text(self):
+        """阻塞直到生成结束，返回完整回答"""
+        return "".join(self)
+
+    @classmethod
+    def completed(cls, prompt, text):
+        flight = cls(prompt)
+        flight.chunks.append(text)
+        flight.done = True
+        return flight
+
+
+class ChatServer:
+    """
+    Gradio 界面背后的服务层：
+    - 有界请求队列：排队数达到上限时拒绝新请求（ServerBusy），避免请求无限堆积
+    - 单飞去重：相同问题在生成过程中只调用一次模型，所有请求共享同一个流式结果
+    - 微批：后端提供 batch_generate 时，调度线程在很短的时间窗口内收集请求，整批一次发往后端；
+      没有 batch_generate 时（如 03.py 直接调用 Ollama）不等待凑批，请求一到就单独流式发出，
+      由 Ollama 的并行槽位（OLLAMA_NUM_PARALLEL）在服务端合批
+    - 回答缓存：重复的问题直接从缓存返回
+    """
+
+    def __init__(self, stream, model, batch_generate=None, max_queue=64, max_batch=8, batch_window=0.02,
+                 max_concurrency=8, cache=None, limiter=None):
+        """
+        参数:
+            stream: 流式生成函数 stream(prompt) -> 文本片段的迭代器
+            model: 模型名称，参与缓存键计算
+            batch_generate: 可选的批量生成函数 batch_generate(prompts) -> 回答列表
+            max_queue: 等待调度的请求数上限
+            max_batch: 一个微批的最大请求数
+            batch_window: 收到第一个请求后继续等待凑批的时间，秒；只在提供 batch_generate 时生效
+            max_concurrency: 同时在后端生成的请求数上限
+        """
+        self.stream = stream
+        self.model = model
+        self.batch_generate = batch_generate
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.cache = cache or get_default_cache()
+        self.limiter = limiter or get_default_limiter()
+        self.counters = {"requests": 0, "cache_hits": 0, "deduplicated": 0, "rejected": 0, "batches": 0, "failures": 0}
+        self.latencies = deque(maxlen=1000)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+
+    @staticmethod
+    def normalize(prompt):
+        return " ".join(prompt.split())
+
+    def submit(self, prompt):
+        """
+        提交问题
+        返回：Flight，可迭代得到流式片段，或调用 text() 等待完整回答
+        """
+        prompt = self.normalize(prompt)
+        key = self.cache.make_key(self.model, prompt)
+        with self._lock:
+            self.counters["requests"] += 1
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.counters["deduplicated"] += 1
+                return flight
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self._lock:
+                self.counters["cache_hits"] += 1
+            return Flight.completed(prompt, cached)
+        with self._lock:
+            # 查缓存期间可能已有相同问题提交
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.counters["deduplicated"] += 1
+                return flight
+            flight = Flight(prompt)
+            try:
+                self._queue.put_nowait((key, flight))
+            except queue.Full:
+                self.counters["rejected"] += 1
+                raise ServerBusy(f"请求排队数已达上限 {self._queue.maxsize}")
+            self._inflight[key] = flight
+        return flight
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        if self.batch_generate is None:
+            return batch  # 逐个发出的请求凑批没有收益，只会增加延迟
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._next_batch()
+            if self.batch_generate is not None:
+                with self._lock:
+                    self.counters["batches"] += 1
+                self._slots.acquire()
+                self._executor.submit(self._run_batch, batch)
+                continue
+            for key, flight in batch:
+                # 后端名额用完时在这里阻塞，请求留在有界队列中，形成背压
+                self._slots.acquire()
+                self._executor.submit(self._run_stream, key, flight)
+
+    def _run_stream(self, key, flight):
+        error = None
+        try:
+            with self.limiter.slot() as usage:
+                first_token_at = None
+                for token in self.stream(flight.prompt):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    flight.append(token)
+                if first_token_at is not None:
+                    # 首个片段之前的耗时即排队 + prompt 处理，限流器据此判断服务端是否过载
+                    usage["decode_time"] = time.perf_counter() - first_token_at
+        except Exception as e:
+            error = e
+        finally:
+            self._slots.release()
+        self._complete(key, flight, error)
+
+    def _run_batch(self, batch):
+        error = None
+        answers = [None] * len(batch)
+        try:
+            with self.limiter.slot():
+                answers = list(self.batch_generate([flight.prompt for _, flight in batch]) or [])
+        except Exception as e:
+            error = e
+        finally:
+            self._slots.release()
+        answers += [None] * (len(batch) - len(answers))
+        for (key, flight), answer in zip(batch, answers):
+            if answer:
+                flight.append(answer)
+            self._complete(key, flight, error)
+
+    def _complete(self, key, flight, error):
+        answer = "".join(flight.chunks)
+        if error is None and answer:
+            self.cache.put(key, answer)
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is not None:
+                self.counters["failures"] += 1
+            self.latencies.append(time.perf_counter() - flight.created)
+        flight.finish(error)
+
+    def metrics(self):
+        """请求计数、排队数、进行中的生成数和最近生成请求的 p50/p95 延迟"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            metrics = dict(self.counters, queue_depth=self._queue.qsize(), inflight=len(self._inflight))
+        if latencies:
+            metrics["p50"] = latencies[len(latencies) // 2]
+            metrics["p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return metrics
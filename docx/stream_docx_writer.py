@@ -0,0 +1,167 @@
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from outline_reader import W
+
+# XML 1.0 不允许的控制字符，模型输出中偶尔会出现
+_ILLEGAL_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_DOCUMENT_TAG_RE = re.compile(rb"<w:document\b[^>]*>")
+_SECT_PR_RE = re.compile(rb"<w:sectPr\b.*?</w:sectPr>|<w:sectPr\b[^>]*/>", re.S)
+
+
+def default_template():
+    """python-docx 自带的空白模板，Document() 即基于它创建"""
+    import docx
+
+    return os.path.join(os.path.dirname(docx.__file__), "templates", "default.docx")
+
+
+def read_style_ids(docx_zip):
+    """解析 styles.xml，得到 小写样式名 -> 样式ID 的映射"""
+    try:
+        data = docx_zip.open("word/styles.xml")
+    except KeyError:
+        return {}
+    style_ids = {}
+    with data:
+        for _, elem in ET.iterparse(data):
+            if elem.tag == W + "style":
+                name = elem.find(W + "name")
+                if name is not None:
+                    style_ids[name.get(W + "val", "").lower()] = elem.get(W + "styleId")
+                elem.clear()
+    return style_ids
+
+
+def _run_xml(text):
+    """按 python-docx 中 run.text 的规则生成 w:r：制表符转 w:tab，换行转 w:br"""
+    parts = []
+    for piece in re.split(r"(\t|\r\n|\n|\r)", _ILLEGAL_XML_RE.sub("", text)):
+        if piece == "\t":
+            parts.append("<w:tab/>")
+        elif piece in ("\n", "\r", "\r\n"):
+            parts.append("<w:br/>")
+        elif piece:
+            space = ' xml:space="preserve"' if piece != piece.strip() else ""
+            parts.append(f"<w:t{space}>{escape(piece)}</w:t>")
+    return f"<w:r>{''.join(parts)}</w:r>"
+
+
+class StreamingDocxWriter:
+    """
+    流式写出 docx：样式、页面设置、页眉页脚等取自模板，正文段落逐个写入压缩包中的 word/document.xml，
+    写完的段落不再占用内存，峰值内存与文档大小无关
+    生成的段落结构与 python-docx 的 add_heading / add_paragraph 一致
+    先写入 <path>.tmp，正常结束后才替换 path；中途出错或中断时删除临时文件，原有文档保持不变
+    """
+
+    def __init__(self, path, template=None):
+        """
+        参数:
+            path: 输出文件路径
+            template: 模板 docx，例如 index.docx；为 None 时使用 python-docx 的默认模板
+        """
+        template = template or default_template()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.paragraphs = 0
+        self._stream = None
+        self._zip = zipfile.ZipFile(self.tmp_path, "w", compression=zipfile.ZIP_DEFLATED)
+        try:
+            with zipfile.ZipFile(template) as source:
+                self.style_ids = read_style_ids(source)
+                document_xml = source.read("word/document.xml")
+                # 复制模板中除正文外的所有部件
+                for item in source.infolist():
+                    if item.filename != "word/document.xml":
+                        self._zip.writestr(item, source.read(item.filename))
+
+            match = _DOCUMENT_TAG_RE.search(document_xml)
+            if match is None:
+                raise ValueError(f"模板 {template} 中没有 w:document 元素")
+            sections = _SECT_PR_RE.findall(document_xml)
+            # 正文最后一个 sectPr 是整篇文档的页面设置
+            self._sect_pr = sections[-1] if sections else b""
+            self._stream = self._zip.open("word/document.xml", "w")
+            self._stream.write(b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n")
+            self._stream.write(match.group(0) + b"<w:body>")
+        except BaseException:
+            self.abort()
+            raise
+
+    def _style_id(self, name):
+        return self.style_ids.get(name.lower(), name.replace(" ", ""))
+
+    def add_paragraph(self, text="", style=None):
+        """写入一个段落，style 为样式名，如 "List Bullet" """
+        ppr = f'<w:pPr><w:pStyle w:val="{escape(self._style_id(style))}"/></w:pPr>' if style else ""
+        run = _run_xml(text) if text else ""
+        xml = f"<w:p>{ppr}{run}</w:p>" if ppr or run else "<w:p/>"
+        self._stream.write(xml.encode("utf-8"))
+        self.paragraphs += 1
+
+    def add_heading(self, text="", level=1):
+        """写入标题，level 为 0 时使用 Title 样式，与 python-docx 一致"""
+        if not 0 <= level <= 9:
+            raise ValueError(f"标题级别必须在 0~9 之间，实际为 {level}")
+        self.add_paragraph(text, "Title" if level == 0 else f"Heading {level}")
+
+    def close(self):
+        """写完文档，用完整的临时文件替换 path"""
+        if self._zip is None:
+            return
+        self._stream.write(self._sect_pr + b"</w:body></w:document>")
+        self._stream.close()
+        self._stream = None
+        self._zip.close()
+        self._zip = None
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """放弃写入：关闭并删除临时文件，path 处原有的文档不受影响"""
+        if self._zip is None:
+            return
+        try:
+            if self._stream is not None:
+                self._stream.close()
+            self._zip.close()
+        finally:
+            self._stream = None
+            self._zip = None
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class OrderedSections:
+    """
+    并发生成时章节按完成顺序到达，这里只缓存尚未轮到的章节，
+    前面的章节都到齐后立即按大纲顺序写出
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.next_pos = 0
+        self._pending = {}
+
+    def put(self, pos, level, title, text):
+        self._pending[pos] = (level, title, text)
+        while self.next_pos in self._pending:
+            level, title, text = self._pending.pop(self.next_pos)
+            self.writer.add_heading(title, level)
+            self.writer.add_paragraph(text)
+            self.next_pos += 1
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from ollama_client import embed
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "vectors")
+
+# 向量数超过该值时自动建立 IVF 粗量化索引，检索只扫描最近的几个簇
+IVF_THRESHOLD = 50000
+# 分块计算相似度，避免一次把整个 float16 矩阵转成 float32
+SCAN_BLOCK_ROWS = 65536
+
+
+def chunk_paragraphs(text, max_chars=500):
+    """
+    按空行把文本切成段落；没有空行的文本按行合并，每块不超过 max_chars 个字符
+    返回：文本块列表
+    """
+    chunks, current = [], ""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            if current:
+                chunks.append(current)
+                current = ""
+            continue
+        if current and len(current) + len(line) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        # 单行超长时直接截成多块
+        while len(line) > max_chars:
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class VectorStore:
+    """
+    参考资料的向量库，存放在一个目录中：
+    - vectors.f16：float16 的内存映射矩阵，每行一个已归一化的段落向量
+    - ids.jsonl：与矩阵各行对应的 (来源, 段落文本)
+    - manifest.json：模型、维度和各来源的内容哈希及行范围
+    - ivf.npz：可选的 IVF 索引（簇中心、按簇排序的行号和各簇起始位置）
+    按内容哈希增量更新，只为新增或有变化的来源计算向量
+    """
+
+    def __init__(self, directory=DEFAULT_STORE_DIR, model="nomic-embed-text", embed_fn=None):
+        """
+        参数:
+            model: 向量模型名称，更换模型后已有向量全部失效
+            embed_fn: 可选的向量函数 embed_fn(texts) -> 向量列表，例如本地 sentence-transformers 模型；
+                      默认经 Ollama /api/embed 批量计算
+        """
+        self.directory = directory
+        self.model = model
+        self.embed_fn = embed_fn or (lambda texts: embed(texts, model=model))
+        self.manifest = {"model": model, "dim": 0, "count": 0, "sources": {}}
+        self.ids = []
+        self.vectors = None
+        self.ivf = None
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not os.path.exists(self._path("manifest.json")):
+            return
+        with open(self._path("manifest.json"), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest.get("model") != self.model:
+            return
+        self.manifest = manifest
+        with open(self._path("ids.jsonl"), "r", encoding="utf-8") as file:
+            self.ids = [tuple(json.loads(line)) for line in file]
+        if manifest["count"]:
+            self.vectors = np.memmap(
+                self._path("vectors.f16"), dtype=np.float16, mode="r", shape=(manifest["count"], manifest["dim"])
+            )
+        if os.path.exists(self._path("ivf.npz")):
+            with np.load(self._path("ivf.npz")) as data:
+                self.ivf = {name: data[name] for name in data.files}
+
+    def update(self, documents, ivf=None):
+        """
+        增量更新向量库
+        参数:
+            documents: {来源名称: 文本}
+            ivf: True/False 强制建立或不建立 IVF 索引，None 时按向量数自动决定
+        返回：本次新计算向量的段落数
+        """
+        old_sources = self.manifest["sources"]
+        hashes = {name: _content_hash(text) for name, text in documents.items()}
+        changed = [name for name in documents if old_sources.get(name, {}).get("hash") != hashes[name]]
+        if not changed and set(old_sources) == set(documents):
+            return 0
+
+        new_chunks = {name: chunk_paragraphs(documents[name]) for name in changed}
+        texts = [text for name in changed for text in new_chunks[name]]
+        new_vectors = np.asarray(self.embed_fn(texts), dtype=np.float32) if texts else None
+        dim = new_vectors.shape[1] if new_vectors is not None else self.manifest["dim"]
+
+        # 按来源顺序拼出新矩阵：未变化的来源直接复制旧行，有变化的写入新向量
+        count = sum(len(new_chunks[name]) if name in new_chunks else old_sources[name]["count"] for name in documents)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_vectors = self._path("vectors.f16.tmp")
+        matrix = np.memmap(tmp_vectors, dtype=np.float16, mode="w+", shape=(max(count, 1), max(dim, 1)))
+        sources, ids = {}, []
+        row = offset = 0
+        for name in documents:
+            if name in new_chunks:
+                chunks = new_chunks[name]
+                if chunks:
+                    matrix[row:row + len(chunks)] = _normalize(new_vectors[offset:offset + len(chunks)])
+                offset += len(chunks)
+            else:
+                start, size = old_sources[name]["start"], old_sources[name]["count"]
+                # 全部来源都没有段落时旧矩阵不存在（vectors 为 None），没有可复制的行
+                if size and self.vectors is not None:
+                    matrix[row:row + size] = self.vectors[start:start + size]
+                chunks = [text for _, text in self.ids[start:start + size]]
+            sources[name] = {"hash": hashes[name], "start": row, "count": len(chunks)}
+            ids.extend((name, text) for text in chunks)
+            row += len(chunks)
+        matrix.flush()
+        del matrix
+
+        with open(self._path("ids.jsonl.tmp"), "w", encoding="utf-8") as file:
+            for entry in ids:
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        manifest = {"model": self.model, "dim": dim, "count": count, "sources": sources}
+        with open(self._path("manifest.json.tmp"), "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        # 先替换数据文件，最后替换 manifest，中途中断时旧 manifest 与新文件不匹配会在下次全部重建
+        self.vectors = None
+        os.replace(tmp_vectors, self._path("vectors.f16"))
+        os.replace(self._path("ids.jsonl.tmp"), self._path("ids.jsonl"))
+        if os.path.exists(self._path("ivf.npz")):
+            os.remove(self._path("ivf.npz"))
+        os.replace(self._path("manifest.json.tmp"), self._path("manifest.json"))
+        self.ivf = None
+        self._load()
+
+        if ivf or (ivf is None and count >= IVF_THRESHOLD):
+            self.build_ivf()
+        return len(texts)
+
+    def build_ivf(self, n_lists=None, iterations=10, sample_size=20000, seed=0):
+        """用 k-means 建立 IVF 粗量化索引：向量按最近的簇中心分组"""
+        count = self.manifest["count"]
+        if not count:
+            return
+        n_lists = n_lists or max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(count, size=min(sample_size, count), replace=False))
+        sample = np.asarray(self.vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=min(n_lists, len(sample)), replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(len(centroids)):
+                members = sample[assignment == i]
+                if len(members):
+                    centroids[i] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assignment = np.empty(count, dtype=np.int32)
+        for start in range(0, count, SCAN_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1)).astype(np.int64)
+        self.ivf = {"centroids": centroids.astype(np.float32), "order": order, "offsets": offsets}
+        np.savez(self._path("ivf.npz"), **self.ivf)
+
+    def _scan(self, query):
+        """对全部向量分块计算余弦相似度"""
+        count = self.manifest["count"]
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCAN_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        return np.arange(count), scores
+
+    def _probe(self, query, nprobe):
+        """只计算离查询最近的 nprobe 个簇中的向量"""
+        centroids, order, offsets = self.ivf["centroids"], self.ivf["order"], self.ivf["offsets"]
+        nearest = np.argsort(-(centroids @ query))[:nprobe]
+        rows = np.sort(np.concatenate([order[offsets[i]:offsets[i + 1]] for i in nearest]))
+        return rows, np.asarray(self.vectors[rows], dtype=np.float32) @ query
+
+    def search(self, query, top_k=5, nprobe=8):
+        """
+        语义检索
+        参数:
+            query: 查询文本
+            nprobe: 使用 IVF 索引时扫描的簇数
+        返回：[(来源, 段落文本, 余弦相似度)]，按相似度从高到低排列
+        """
+        if not self.manifest["count"]:
+            return []
+        vector = _normalize(np.asarray(self.embed_fn([query]), dtype=np.float32))[0]
+        rows, scores = self._probe(vector, nprobe) if self.ivf is not None else self._scan(vector)
+        if not len(rows):
+            return []
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(*self.ids[rows[i]], float(scores[i])) for i in top]
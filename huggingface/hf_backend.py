@@ -0,0 +1,228 @@
+"""
+本地 Hugging Face 推理后端：进程内批量生成，不经过 HTTP
+
+- 按 prompt 的 token 长度排序后分桶，每批只补齐到本批最长的 prompt（动态 padding）
+- CPU 上可选 bf16 或 int8（对 Linear 层做动态量化）
+- generate / stream_generate 的参数和 stats 字段与 docx/ollama_client.py 一致，可直接替换
+- generate_batch 一次生成多个章节，并报告 tokens/s
+
+用法：
+    python huggingface/hf_backend.py docx/index.docx --model meta-llama/Llama-3.2-1B --dtype bf16 --max-batch-size 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import torch
+from transformers import TextIteratorStreamer, pipeline
+
+DTYPES = ("fp32", "bf16", "int8")
+DEFAULT_MAX_NEW_TOKENS = 512
+
+
+def _batches(lengths, max_batch_size, max_batch_tokens):
+    """
+    按长度排序后切成批次，一批的 (条数 × 最长长度) 不超过 max_batch_tokens
+    返回：原始下标组成的批次列表
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, current = [], []
+    for i in order:
+        # 排序后当前 prompt 就是本批最长的
+        if current and (len(current) >= max_batch_size or (len(current) + 1) * lengths[i] > max_batch_tokens):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class HFBackend:
+    """进程内的 transformers 推理后端"""
+
+    def __init__(self, model="meta-llama/Llama-3.2-1B", dtype="bf16", max_batch_size=8, max_batch_tokens=16384,
+                 device_map=None, num_threads=None):
+        """
+        参数:
+            model: Hugging Face 模型名称或本地路径
+            dtype: fp32 / bf16 / int8，int8 为对 Linear 层的动态量化，仅用于 CPU
+            max_batch_size: 一批最多的 prompt 数
+            max_batch_tokens: 一批补齐后的 token 总数上限，避免长 prompt 与大批量同时出现导致内存不足
+            device_map: 传给 pipeline，None 表示 CPU
+            num_threads: CPU 推理线程数，默认由 torch 决定
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"未知的数据类型：{dtype}，可选值为 {DTYPES}")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model_name = model
+        self.dtype = dtype
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.recent_stats = deque(maxlen=1000)
+
+        torch_dtype = torch.bfloat16 if dtype == "bf16" else torch.float32
+        start = time.perf_counter()
+        self.pipe = pipeline("text-generation", model=model, torch_dtype=torch_dtype, device_map=device_map)
+        self.model = self.pipe.model
+        self.tokenizer = self.pipe.tokenizer
+        if dtype == "int8":
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model.eval()
+        # 解码器模型需要左侧补齐，生成的新 token 才能紧接在各自 prompt 之后
+        self.tokenizer.padding_side = "left"
+        self.tokenizer.truncation_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.load_time = time.perf_counter() - start
+
+    def _generation_kwargs(self, options):
+        """把 Ollama 风格的 options 转成 generate 参数"""
+        options = options or {}
+        max_new_tokens = options.get("num_predict") or DEFAULT_MAX_NEW_TOKENS
+        kwargs = {"max_new_tokens": max_new_tokens, "pad_token_id": self.tokenizer.pad_token_id}
+        temperature = options.get("temperature")
+        if temperature:
+            kwargs.update(do_sample=True, temperature=temperature, top_p=options.get("top_p", 1.0))
+        else:
+            kwargs["do_sample"] = False
+        # num_ctx 限制 prompt 与生成的总长度，超出时从左侧截断 prompt
+        max_prompt = options["num_ctx"] - max_new_tokens if options.get("num_ctx") else None
+        return kwargs, max_prompt
+
+    def _encode(self, prompts, max_prompt):
+        return self.tokenizer(
+            prompts, return_tensors="pt", padding=True,
+            truncation=max_prompt is not None, max_length=max_prompt,
+        ).to(self.model.device)
+
+    def generate_batch(self, prompts, options=None, stats=None):
+        """
+        批量生成，结果顺序与 prompts 一致
+        参数:
+            stats: 可选的字典，写入本次调用的总 token 数、耗时和 tokens_per_sec
+        """
+        if not prompts:
+            return []
+        kwargs, max_prompt = self._generation_kwargs(options)
+        lengths = [len(ids) for ids in self.tokenizer(list(prompts), truncation=max_prompt is not None,
+                                                     max_length=max_prompt)["input_ids"]]
+        results = [None] * len(prompts)
+        prompt_tokens = completion_tokens = 0
+        start = time.perf_counter()
+        for batch in _batches(lengths, self.max_batch_size, self.max_batch_tokens):
+            inputs = self._encode([prompts[i] for i in batch], max_prompt)
+            with torch.inference_mode():
+                output = self.model.generate(**inputs, **kwargs)
+            new_tokens = output[:, inputs["input_ids"].shape[1]:]
+            texts = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+            for i, text, tokens in zip(batch, texts, new_tokens):
+                results[i] = text.strip()
+                # 不计入生成结束后补齐的 pad token
+                completion_tokens += int((tokens != self.tokenizer.pad_token_id).sum())
+            prompt_tokens += int(inputs["attention_mask"].sum())
+        elapsed = time.perf_counter() - start
+
+        batch_stats = {
+            "model": self.model_name,
+            "total_time": elapsed,
+            "ttft": None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "prefill_time": None,
+            "decode_time": elapsed,
+            "tokens_per_sec": completion_tokens / elapsed if elapsed > 0 else None,
+        }
+        self.recent_stats.append(batch_stats)
+        if stats is not None:
+            stats.update(batch_stats)
+        return results
+
+    def stream_generate(self, prompt, model=None, base_url=None, options=None, stats=None, keep_alive=None):
+        """
+        流式生成单个回答，参数与 ollama_client.stream_generate 一致（model/base_url/keep_alive 在本地推理中不使用）
+        返回：文本片段的生成器
+        """
+        kwargs, max_prompt = self._generation_kwargs(options)
+        inputs = self._encode([prompt], max_prompt)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        stats = {} if stats is None else stats
+        errors = []
+
+        def run():
+            try:
+                with torch.inference_mode():
+                    self.model.generate(**inputs, **kwargs, streamer=streamer)
+            except Exception as e:  # 让调用方在迭代结束后看到异常
+                errors.append(e)
+                streamer.end()
+
+        start = time.perf_counter()
+        first_token_at = None
+        text = ""
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        for token in streamer:
+            if not token:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            text += token
+            yield token
+        worker.join()
+        if errors:
+            raise errors[0]
+
+        end = time.perf_counter()
+        completion_tokens = len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+        decode_time = end - first_token_at if first_token_at is not None else 0.0
+        stats.update({
+            "model": self.model_name,
+            "total_time": end - start,
+            "ttft": first_token_at - start if first_token_at is not None else None,
+            "prompt_tokens": int(inputs["attention_mask"].sum()),
+            "completion_tokens": completion_tokens,
+            "prefill_time": first_token_at - start if first_token_at is not None else None,
+            "decode_time": decode_time,
+            "tokens_per_sec": completion_tokens / decode_time if decode_time > 0 else None,
+        })
+        self.recent_stats.append(dict(stats))
+
+    def generate(self, prompt, model=None, base_url=None, options=None, stats=None, keep_alive=None):
+        """生成单个完整回答，参数与 ollama_client.generate 一致"""
+        return self.generate_batch([prompt], options, stats)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用本地 Hugging Face 模型批量生成整份大纲的内容")
+    parser.add_argument("outline", help="包含目录大纲的 docx 文件")
+    parser.add_argument("--model", default="meta-llama/Llama-3.2-1B")
+    parser.add_argument("--dtype", choices=DTYPES, default="bf16")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docx"))
+    from outline_reader import read_outline
+
+    outline = read_outline(args.outline)
+    backend = HFBackend(args.model, args.dtype, args.max_batch_size, num_threads=args.threads)
+    print(f"模型加载用时 {backend.load_time:.1f}s")
+    prompts = [f"请为标题“{title}”撰写一段内容：" for _, title in outline]
+    stats = {}
+    answers = backend.generate_batch(prompts, {"num_predict": args.max_new_tokens}, stats)
+    for (level, title), answer in zip(outline, answers):
+        print(f"{'#' * level} {title}\n{answer}\n")
+    print(
+        f"{len(prompts)} 个章节，生成 {stats['completion_tokens']} tokens，用时 {stats['total_time']:.1f}s，"
+        f"{stats['tokens_per_sec'] or 0:.1f} tokens/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
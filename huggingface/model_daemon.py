@@ -0,0 +1,280 @@
+"""
+常驻模型守护进程：模型只加载一次，docx 脚本经 Unix socket 请求生成，省去每次运行的模型加载时间
+
+- 启动时预热：加载模型并做一次短生成
+- 空闲超过 idle_unload 秒后卸载模型释放内存，下一个请求到来时重新加载
+- 同时生成的请求数有上限，超出的请求排队
+- 客户端 get_backend() 在守护进程不存在或加载的是其他模型时退回到进程内加载模型
+
+协议：每行一个 JSON 请求，每行一个 JSON 响应
+    {"op": "generate", "model": "...", "prompts": [...], "options": {...}} -> {"ok": true, "results": [...], "stats": {...}}
+    {"op": "ping"} -> {"ok": true, "model": "..."}
+    {"op": "stats"}
+    generate 请求带 model 时必须与守护进程加载的模型一致，否则返回错误
+
+用法：
+    python huggingface/model_daemon.py serve --model meta-llama/Llama-3.2-1B --dtype bf16
+    python huggingface/model_daemon.py bench            # 对比冷启动与常驻模型的延迟
+"""
+import argparse
+import gc
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+
+DEFAULT_SOCKET = os.environ.get("HF_DAEMON_SOCKET", "/tmp/hf_model_daemon.sock")
+# 客户端等待一次生成的最长时间；CPU 上批量生成长文本可能需要几分钟，但守护进程卡死时不能无限等待
+DEFAULT_TIMEOUT = 600.0
+WARMUP_PROMPT = "你好"
+
+
+class ModelHolder:
+    """持有常驻模型，负责按需加载、预热、空闲卸载和并发限制"""
+
+    def __init__(self, model, dtype="bf16", max_batch_size=8, idle_unload=600.0, max_concurrency=1):
+        self.model = model
+        self.dtype = dtype
+        self.max_batch_size = max_batch_size
+        self.idle_unload = idle_unload
+        self.backend = None
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        self.counters = {"requests": 0, "loads": 0, "unloads": 0}
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def load(self):
+        """加载模型（已加载时直接返回），返回本次加载耗时，已加载时为 0"""
+        with self._load_lock:
+            if self.backend is not None:
+                return 0.0
+            from hf_backend import HFBackend
+
+            start = time.perf_counter()
+            self.backend = HFBackend(self.model, dtype=self.dtype, max_batch_size=self.max_batch_size)
+            self.counters["loads"] += 1
+            return time.perf_counter() - start
+
+    def warm_up(self):
+        """加载模型并做一次短生成，让权重、线程池和内存分配都进入稳定状态"""
+        load_time = self.load()
+        start = time.perf_counter()
+        self.backend.generate_batch([WARMUP_PROMPT], {"num_predict": 4})
+        print(f"模型 {self.model} 加载 {load_time:.1f}s，预热 {time.perf_counter() - start:.1f}s")
+
+    def unload_if_idle(self):
+        with self._state_lock:
+            idle = time.monotonic() - self.last_used
+            if self.backend is None or self.in_flight or idle < self.idle_unload:
+                return False
+            with self._load_lock:
+                self.backend = None
+                self.counters["unloads"] += 1
+        gc.collect()
+        print(f"空闲 {idle:.0f}s，已卸载模型")
+        return True
+
+    def generate(self, prompts, options=None):
+        queued_at = time.perf_counter()
+        with self._slots:
+            queue_time = time.perf_counter() - queued_at
+            with self._state_lock:
+                self.in_flight += 1
+                self.counters["requests"] += 1
+            try:
+                load_time = self.load()
+                stats = {}
+                results = self.backend.generate_batch(prompts, options, stats)
+            finally:
+                with self._state_lock:
+                    self.in_flight -= 1
+                    self.last_used = time.monotonic()
+        # cold 表示本次请求触发了模型加载
+        stats.update(cold=load_time > 0, load_time=load_time, queue_time=queue_time)
+        return results, stats
+
+    def stats(self):
+        with self._state_lock:
+            return dict(self.counters, loaded=self.backend is not None, in_flight=self.in_flight,
+                        idle_seconds=time.monotonic() - self.last_used)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        holder = self.server.holder
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "generate" and request.get("model") not in (None, holder.model):
+                    response = {"ok": False, "error": f"守护进程加载的模型是 {holder.model}，不是 {request['model']}"}
+                elif op == "generate":
+                    results, stats = holder.generate(request["prompts"], request.get("options"))
+                    response = {"ok": True, "results": results, "stats": stats}
+                elif op == "ping":
+                    response = {"ok": True, "model": holder.model}
+                elif op == "stats":
+                    response = {"ok": True, "stats": holder.stats()}
+                else:
+                    response = {"ok": False, "error": f"未知的操作：{op}"}
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class ModelDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, holder, socket_path=DEFAULT_SOCKET):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # 上次异常退出留下的 socket 文件
+        super().__init__(socket_path, _Handler)
+        self.holder = holder
+        self.socket_path = socket_path
+
+    def serve(self, warm_up=True):
+        if warm_up:
+            self.holder.warm_up()
+
+        def reaper():
+            while True:
+                time.sleep(min(30.0, max(self.holder.idle_unload / 4, 1.0)))
+                self.holder.unload_if_idle()
+
+        threading.Thread(target=reaper, daemon=True).start()
+        print(f"模型守护进程已启动：{self.socket_path}")
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class DaemonClient:
+    """守护进程客户端，接口与 HFBackend 的 generate / generate_batch 一致"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, model=None, timeout=DEFAULT_TIMEOUT):
+        """
+        参数:
+            model: 期望的模型，生成请求会带上它，守护进程加载的不是该模型时拒绝请求；None 表示不检查
+            timeout: 单次请求的超时秒数
+        """
+        self.socket_path = socket_path
+        self.model = model
+        self.timeout = timeout
+        self.recent_stats = deque(maxlen=1000)
+
+    def _request(self, payload, timeout=None):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout or self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as reader:
+                response = json.loads(reader.readline())
+        if not response.get("ok"):
+            raise RuntimeError(f"模型守护进程返回错误：{response.get('error')}")
+        return response
+
+    def ping(self):
+        """返回守护进程加载的模型名称，守护进程不可用时返回 None"""
+        try:
+            # socket 文件存在但进程已无响应时不能一直等待
+            return self._request({"op": "ping"}, timeout=2.0).get("model")
+        except (OSError, ValueError, RuntimeError):
+            return None
+
+    def generate_batch(self, prompts, options=None, stats=None):
+        start = time.perf_counter()
+        request = {"op": "generate", "prompts": list(prompts), "options": options}
+        if self.model is not None:
+            request["model"] = self.model
+        response = self._request(request)
+        response["stats"]["round_trip"] = time.perf_counter() - start
+        self.recent_stats.append(response["stats"])
+        if stats is not None:
+            stats.update(response["stats"])
+        return response["results"]
+
+    def generate(self, prompt, model=None, base_url=None, options=None, stats=None, keep_alive=None):
+        return self.generate_batch([prompt], options, stats)[0]
+
+    def stats(self):
+        return self._request({"op": "stats"})["stats"]
+
+
+def get_backend(model="meta-llama/Llama-3.2-1B", dtype="bf16", max_batch_size=8, socket_path=DEFAULT_SOCKET):
+    """
+    优先连接加载了同一模型的常驻守护进程；守护进程不存在或模型不同时在当前进程内加载模型
+    返回：DaemonClient 或 HFBackend，两者都提供 generate / generate_batch
+    """
+    client = DaemonClient(socket_path, model=model)
+    served = client.ping() if os.path.exists(socket_path) else None
+    if served == model:
+        return client
+    if served is None:
+        print(f"未发现模型守护进程（{socket_path}），在当前进程内加载模型 {model}")
+    else:
+        print(f"模型守护进程加载的是 {served}，不是 {model}，在当前进程内加载模型")
+    from hf_backend import HFBackend
+
+    return HFBackend(model, dtype=dtype, max_batch_size=max_batch_size)
+
+
+def bench(args):
+    """对比冷启动（进程内加载后生成）与常驻模型（经守护进程）的单次请求延迟"""
+    prompt, options = "请用一句话介绍项目管理。", {"num_predict": args.max_new_tokens}
+    from hf_backend import HFBackend
+
+    start = time.perf_counter()
+    backend = HFBackend(args.model, dtype=args.dtype)
+    backend.generate(prompt, options=options)
+    cold = time.perf_counter() - start
+    del backend
+    gc.collect()
+    print(f"冷启动（加载 + 生成）：{cold:.2f}s")
+
+    client = DaemonClient(args.socket, model=args.model)
+    served = client.ping()
+    if served != args.model:
+        print(f"守护进程未运行或加载的不是 {args.model}，跳过常驻模型的对比；请先运行 serve 子命令")
+        return
+    latencies = []
+    for _ in range(args.repeat):
+        stats = {}
+        client.generate(prompt, options=options, stats=stats)
+        latencies.append(stats["round_trip"])
+    warm = sorted(latencies)[len(latencies) // 2]
+    print(f"常驻模型（中位数，{args.repeat} 次）：{warm:.2f}s，每次运行节省约 {cold - warm:.2f}s（{cold / warm:.1f} 倍）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻模型守护进程")
+    parser.add_argument("command", choices=("serve", "bench", "stats"))
+    parser.add_argument("--model", default="meta-llama/Llama-3.2-1B")
+    parser.add_argument("--dtype", default="bf16")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-concurrency", type=int, default=1, help="同时生成的请求数，CPU 推理通常为 1")
+    parser.add_argument("--idle-unload", type=float, default=600.0, help="空闲多少秒后卸载模型")
+    parser.add_argument("--no-warm-up", action="store_true")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        holder = ModelHolder(args.model, args.dtype, args.max_batch_size, args.idle_unload, args.max_concurrency)
+        ModelDaemon(holder, args.socket).serve(warm_up=not args.no_warm_up)
+    elif args.command == "bench":
+        bench(args)
+    else:
+        print(json.dumps(DaemonClient(args.socket).stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,151 @@
-from torch.utils.data import Dataset
+"""
+图片文件夹数据集：root_dir 下每个子文件夹是一个类别，文件夹名即类别名
+    root_dir/ants/xxx.jpg
+    root_dir/bees/yyy.jpg
+
+- 文件索引在首次使用时构建一次并缓存到磁盘，目录未变化时直接读取
+- 图片在 __getitem__ 中按需解码，不预先读入内存
+- cache=True 时把解码并缩放后的 uint8 张量放进共享内存，第一轮之后不再解码 JPEG，
+  DataLoader 的各个 worker 进程共用同一份缓存
+"""
+import json
+import os
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+import torch
 from PIL import Image
-import os 
+from torch.utils.data import Dataset
+
+IMG_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+INDEX_VERSION = 1
+
+
+def _directory_signature(root_dir, classes):
+    """
+    各类别目录的修改时间，增删图片后会变化；增删类别由类别列表本身反映
+    不使用根目录的修改时间：索引文件默认写在根目录下，写入时会改变它
+    """
+    return {name: os.stat(os.path.join(root_dir, name)).st_mtime_ns for name in classes}
+
+
+def _list_classes(root_dir):
+    return sorted(entry.name for entry in os.scandir(root_dir) if entry.is_dir() and not entry.name.startswith("."))
+
 
 class MyData(Dataset):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        root_dir: str,
+        image_size: Optional[Tuple[int, int]] = None,
+        transform: Optional[Callable] = None,
+        cache: bool = False,
+        index_path: Optional[str] = None,
+        rebuild_index: bool = False,
+    ) -> None:
+        """
+        参数:
+            root_dir: 数据集根目录，每个子文件夹是一个类别
+            image_size: (高, 宽)，解码后缩放到该尺寸；为 None 时保持原尺寸
+            transform: 作用在 uint8 张量 (C, H, W) 上的变换，如转为 float 和归一化；缓存的是变换前的张量
+            cache: 是否在共享内存中缓存解码后的张量，需要指定 image_size
+            index_path: 索引缓存文件，默认为 root_dir/.mydata_index.json，目录不可写时只保存在内存中
+            rebuild_index: 忽略已有的索引缓存，重新扫描目录
+        """
         super().__init__()
+        if cache and image_size is None:
+            raise ValueError("共享内存缓存要求所有图片尺寸一致，请指定 image_size")
+        self.root_dir = root_dir
+        self.image_size = tuple(image_size) if image_size is not None else None
+        self.transform = transform
+        self.index_path = index_path or os.path.join(root_dir, ".mydata_index.json")
+        self.rebuild_index = rebuild_index
+        self.classes = None
+        self.samples = None  # [(相对路径, 类别编号), ...]
+        self._cache = None
+        self._cached = None  # 与 _cache 对应的标记，1 表示该样本已写入缓存
+
+        if cache:
+            # 共享内存必须在创建 DataLoader 之前分配，worker 进程才会继承同一块内存
+            self._ensure_index()
+            height, width = self.image_size
+            self._cache = torch.empty((len(self.samples), 3, height, width), dtype=torch.uint8).share_memory_()
+            self._cached = torch.zeros(len(self.samples), dtype=torch.uint8).share_memory_()
+
+    def _ensure_index(self):
+        """首次使用时构建索引；在创建 DataLoader 前调用（如 len(dataset)），worker 进程会直接继承"""
+        if self.samples is not None:
+            return
+        classes = _list_classes(self.root_dir)
+        signature = _directory_signature(self.root_dir, classes)
+        if not self.rebuild_index and os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, encoding="utf-8") as file:
+                    index = json.load(file)
+                if index.get("version") == INDEX_VERSION and index.get("signature") == signature:
+                    self.classes = index["classes"]
+                    self.samples = [tuple(sample) for sample in index["samples"]]
+                    return
+            except (OSError, ValueError, KeyError):
+                pass  # 索引文件损坏时重新扫描
 
+        samples = []
+        for label, name in enumerate(classes):
+            with os.scandir(os.path.join(self.root_dir, name)) as entries:
+                files = sorted(
+                    entry.name for entry in entries
+                    if entry.is_file() and entry.name.lower().endswith(IMG_EXTENSIONS)
+                )
+            samples.extend((f"{name}/{file_name}", label) for file_name in files)
+        self.classes = classes
+        self.samples = samples
+
+        index = {"version": INDEX_VERSION, "signature": signature, "classes": classes, "samples": samples}
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(index, file, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # 只读目录或写入中途出错：索引只保存在内存中，不留下写了一半的临时文件
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _decode(self, path):
+        """解码一张图片，返回 uint8 张量 (3, H, W)"""
+        # 每次调用时打开文件并在返回前关闭，数据集对象不持有文件句柄，可以安全地复制到 worker 进程
+        with Image.open(path) as image:
+            if self.image_size is not None:
+                height, width = self.image_size
+                # JPEG 可在解码时直接按 1/2、1/4、1/8 缩小，比完整解码后再缩放快得多
+                image.draft("RGB", (width, height))
+                image = image.convert("RGB").resize((width, height), Image.BILINEAR)
+            else:
+                image = image.convert("RGB")
+            array = np.asarray(image, dtype=np.uint8)
+        return torch.from_numpy(array.copy()).permute(2, 0, 1)
+
+    def __len__(self) -> int:
+        self._ensure_index()
+        return len(self.samples)
 
     def __getitem__(self, index) -> Any:
-        return super().__getitem__(index) 
\ No newline at end of file
+        self._ensure_index()
+        relative_path, label = self.samples[index]
+        if self._cache is not None and self._cached[index]:
+            image = self._cache[index].clone()  # 复制一份，transform 原地修改时不会破坏缓存
+        else:
+            image = self._decode(os.path.join(self.root_dir, relative_path))
+            if self._cache is not None:
+                # 先写数据再置标记；两个 worker 同时解码同一张图时写入的内容相同，不需要加锁
+                self._cache[index].copy_(image)
+                self._cached[index] = 1
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, label
+
+    def cache_info(self):
+        """返回 (已缓存的样本数, 缓存占用的字节数)"""
+        if self._cache is None:
+            return 0, 0
+        return int(self._cached.sum()), self._cache.numel() * self._cache.element_size()
@@ -0,0 +1,94 @@
+"""
+数据加载吞吐量基准测试：生成一批 JPEG 图片，比较不同 worker 数、开启与不开启共享内存缓存时的 samples/sec。
+开启缓存时第一轮会解码并写入缓存，之后各轮直接读缓存。
+
+用法：
+    python pytorch/bench_dataset.py --images 2000 --workers 0 2 4 8 --epochs 3
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import time
+
+from PIL import Image
+from torch.utils.data import DataLoader
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_dataset_module():
+    """按路径加载 02.py（文件名以数字开头，无法直接 import）"""
+    spec = importlib.util.spec_from_file_location("mydata", os.path.join(HERE, "02.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["mydata"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# 在模块顶层加载：spawn 方式启动的 worker 重新导入本脚本时，也能按名称找到 MyData 所在的模块
+MyData = load_dataset_module().MyData
+
+
+def make_images(folder, images, classes, size, seed=0):
+    """生成带随机色块的 JPEG 图片，每个类别一个子文件夹"""
+    rng = random.Random(seed)
+    for i in range(images):
+        class_dir = os.path.join(folder, f"class{i % classes}")
+        os.makedirs(class_dir, exist_ok=True)
+        image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+        for _ in range(8):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            image.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + size[0] // 4, y + size[1] // 4))
+        image.save(os.path.join(class_dir, f"img{i}.jpg"), quality=90)
+
+
+def run_epochs(dataset, workers, batch_size, epochs):
+    """返回每一轮的 samples/sec"""
+    loader = DataLoader(
+        dataset, batch_size=batch_size, shuffle=True, num_workers=workers,
+        persistent_workers=workers > 0,
+    )
+    rates = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        count = 0
+        for images, _ in loader:
+            count += images.shape[0]
+        rates.append(count / (time.perf_counter() - start))
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片数据集加载吞吐量基准测试")
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--classes", type=int, default=10)
+    parser.add_argument("--source-size", type=int, nargs=2, default=[640, 480], help="生成图片的宽、高")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[224, 224], help="数据集输出的高、宽")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--epochs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        make_images(folder, args.images, args.classes, tuple(args.source_size))
+
+        start = time.perf_counter()
+        len(MyData(folder, rebuild_index=True))
+        scan = time.perf_counter() - start
+        start = time.perf_counter()
+        len(MyData(folder))
+        print(f"索引：扫描目录 {scan * 1000:.1f}ms，读取缓存的索引 {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        for cache in (False, True):
+            for workers in args.workers:
+                dataset = MyData(folder, image_size=tuple(args.image_size), cache=cache)
+                rates = run_epochs(dataset, workers, args.batch_size, args.epochs)
+                epochs = "，".join(f"{rate:.0f}" for rate in rates)
+                print(f"缓存={'开' if cache else '关'} {workers:>2} 个 worker：每轮 samples/sec {epochs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+本地 seaborn 数据集：从 seaborn-data/ 目录读取，不需要联网
+
+首次加载时把 <name>.csv 转成列式存储：每列一个 NumPy .npy 文件，外加 schema.json 记录列名和类型，
+之后只对用到的列做内存映射，读取几乎不花时间，也不会把整张表读进内存。
+字符串列存为整数编码加类别表，还原成 pandas 时是 Categorical。
+
+用法：
+    from local_data import load_dataset, open_dataset
+    tips = load_dataset("tips")                       # 与 sns.load_dataset 相同，返回 DataFrame
+    table = open_dataset("tips", columns=["tip"])     # 延迟加载，只映射 tip 一列
+    table.sample(10)                                  # 只读取被抽中的 10 行
+"""
+import csv
+import json
+import os
+import shutil
+import urllib.request
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+DATA_HOME = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR_NAME = ".columnar"
+SCHEMA_VERSION = 1
+REMOTE_URL = "https://raw.githubusercontent.com/mwaskom/seaborn-data/master/{name}.csv"
+CHUNK_ROWS = 65536
+
+_BOOL_VALUES = {"True": True, "False": False, "true": True, "false": False}
+# 列类型及对应的 NumPy 类型；category 列保存的是类别编码，-1 表示缺失
+_DTYPES = {"int": "<i8", "float": "<f8", "bool": "|b1", "category": "<i4"}
+
+
+def _value_kind(value):
+    if value in _BOOL_VALUES:
+        return "bool"
+    try:
+        int(value)
+        return "int"
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return "float"
+    except ValueError:
+        return "category"
+
+
+def _merge_kinds(current, new):
+    if current is None or current == new:
+        return new
+    if {current, new} == {"int", "float"}:
+        return "float"
+    return "category"
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _infer_schema(csv_path):
+    """第一遍扫描：推断每列的类型并统计行数，只保存每列的当前类型，内存占用与文件大小无关"""
+    with open(csv_path, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        names = next(reader, None)
+        if names is None:
+            raise ValueError(f"{csv_path} 是空文件，没有表头")
+        kinds = [None] * len(names)
+        missing = [False] * len(names)
+        rows = 0
+        for row in reader:
+            rows += 1
+            for i, name in enumerate(names):
+                value = row[i] if i < len(row) else ""
+                if value == "":
+                    missing[i] = True
+                elif kinds[i] != "category":  # 已经是字符串列的不再判断
+                    kinds[i] = _merge_kinds(kinds[i], _value_kind(value))
+    columns = []
+    for name, kind, has_missing in zip(names, kinds, missing):
+        if kind is None:  # 整列为空
+            kind = "float"
+        elif has_missing and kind == "int":
+            kind = "float"  # 与 pandas 一致，含缺失值的整数列用 NaN 表示缺失
+        elif has_missing and kind == "bool":
+            kind = "category"
+        columns.append({"name": name, "kind": kind})
+    return columns, rows
+
+
+def _parse(kind, value):
+    if kind == "int":
+        return int(value)
+    if kind == "float":
+        return float(value) if value != "" else np.nan
+    return _BOOL_VALUES[value]
+
+
+def convert_csv(csv_path, out_dir):
+    """
+    把 CSV 转成列式存储，分两遍流式读取，按块写入内存映射文件，可处理大于内存的表
+    参数:
+        csv_path: CSV 文件路径
+        out_dir: 输出目录，写入 <序号>.npy 和 schema.json；先写到临时目录，完成后再替换
+    返回：schema 字典
+    """
+    columns, rows = _infer_schema(csv_path)
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    arrays = []
+    for i, column in enumerate(columns):
+        column["file"] = f"{i}.npy"
+        arrays.append(open_memmap(os.path.join(tmp_dir, column["file"]), mode="w+",
+                                  dtype=_DTYPES[column["kind"]], shape=(rows,)))
+    codes = [{} for _ in columns]  # category 列：值 -> 编码，按首次出现的顺序编号
+    buffers = [[] for _ in columns]
+    start = 0
+
+    def flush():
+        nonlocal start
+        count = len(buffers[0]) if buffers else 0
+        for array, buffer in zip(arrays, buffers):
+            array[start:start + count] = buffer
+            buffer.clear()
+        start += count
+
+    with open(csv_path, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        if next(reader, None) is None:  # 两遍读取之间文件被清空
+            raise ValueError(f"{csv_path} 是空文件，没有表头")
+        for row in reader:
+            for i, column in enumerate(columns):
+                value = row[i] if i < len(row) else ""
+                if column["kind"] == "category":
+                    buffers[i].append(-1 if value == "" else codes[i].setdefault(value, len(codes[i])))
+                else:
+                    buffers[i].append(_parse(column["kind"], value))
+            if columns and len(buffers[0]) >= CHUNK_ROWS:
+                flush()
+    flush()
+    # 逐个写回并释放内存映射（flush 闭包引用的是同一个列表），替换目录前不再持有文件句柄
+    while arrays:
+        arrays.pop().flush()
+
+    for column, mapping in zip(columns, codes):
+        if column["kind"] == "category":
+            column["categories"] = list(mapping)
+    schema = {"version": SCHEMA_VERSION, "source": _source_signature(csv_path), "rows": rows, "columns": columns}
+    with open(os.path.join(tmp_dir, "schema.json"), "w", encoding="utf-8") as file:
+        json.dump(schema, file, ensure_ascii=False)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return schema
+
+
+class ColumnarTable:
+    """列式存储的数据集，列在第一次用到时才做内存映射"""
+
+    def __init__(self, directory, schema, columns=None):
+        self.directory = directory
+        self.schema = schema
+        self._columns = {column["name"]: column for column in schema["columns"]}
+        if columns is not None:
+            unknown = [name for name in columns if name not in self._columns]
+            if unknown:
+                raise KeyError(f"数据集中没有这些列：{unknown}")
+        self.columns = list(columns) if columns is not None else list(self._columns)
+        self._arrays = {}
+
+    def __len__(self):
+        return self.schema["rows"]
+
+    @property
+    def shape(self):
+        return len(self), len(self.columns)
+
+    def array(self, name):
+        """返回某列的只读内存映射数组；category 列返回的是类别编码"""
+        if name not in self._arrays:
+            path = os.path.join(self.directory, self._columns[name]["file"])
+            self._arrays[name] = np.load(path, mmap_mode="r")
+        return self._arrays[name]
+
+    def _series_data(self, name, rows=None):
+        values = self.array(name) if rows is None else self.array(name)[rows]
+        column = self._columns[name]
+        if column["kind"] == "category":
+            import pandas as pd
+
+            return pd.Categorical.from_codes(np.asarray(values), categories=column["categories"])
+        return np.asarray(values)
+
+    def _frame(self, rows=None, columns=None):
+        import pandas as pd
+
+        columns = self.columns if columns is None else columns
+        index = None if rows is None else pd.Index(rows)
+        return pd.DataFrame({name: self._series_data(name, rows) for name in columns}, index=index)
+
+    def __getitem__(self, name):
+        """读取整列，返回 pandas Series"""
+        import pandas as pd
+
+        return pd.Series(self._series_data(name), name=name)
+
+    def sample(self, n, random_state=None, columns=None):
+        """
+        随机抽取 n 行（不放回），只从各列的内存映射中读取被抽中的行，不构建整张表
+        返回：DataFrame，索引为原始行号，与 DataFrame.sample 一致
+        """
+        if n > len(self):
+            raise ValueError(f"样本数 {n} 超过了数据集行数 {len(self)}")
+        rng = np.random.default_rng(random_state)
+        # 按行号顺序读取，对内存映射文件是顺序访问
+        rows = np.sort(rng.choice(len(self), size=n, replace=False))
+        return self._frame(rows, columns)
+
+    def head(self, n=5, columns=None):
+        return self._frame(np.arange(min(n, len(self))), columns)
+
+    def to_pandas(self, columns=None):
+        """把选中的列读成完整的 DataFrame"""
+        return self._frame(columns=columns)
+
+
+def _ensure_csv(name, data_home, download):
+    csv_path = os.path.join(data_home, f"{name}.csv")
+    if os.path.exists(csv_path):
+        return csv_path
+    if not download:
+        raise FileNotFoundError(f"本地没有数据集 {name}：请把 {name}.csv 放到 {data_home}")
+    # 只在本地没有 CSV 时下载一次，之后的加载都不需要联网
+    url = REMOTE_URL.format(name=name)
+    print(f"本地没有数据集 {name}，从 {url} 下载到 {csv_path}")
+    tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+    try:
+        urllib.request.urlretrieve(url, tmp_path)
+    except OSError as e:  # URLError 是 OSError 的子类
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise FileNotFoundError(f"下载数据集 {name} 失败（{e}）：请手动把 {name}.csv 放到 {data_home}") from e
+    os.replace(tmp_path, csv_path)
+    return csv_path
+
+
+def open_dataset(name, columns=None, data_home=None, download=True):
+    """
+    打开数据集，CSV 有变化或尚未转换时先转成列式存储
+    参数:
+        name: 数据集名称，对应 data_home 下的 <name>.csv
+        columns: 只使用这些列，默认全部
+        data_home: 数据目录，默认为本文件所在的 seaborn-data/
+        download: 本地没有 CSV 时是否从 seaborn-data 仓库下载
+    返回：ColumnarTable
+    """
+    data_home = data_home or DATA_HOME
+    out_dir = os.path.join(data_home, CACHE_DIR_NAME, name)
+    schema_path = os.path.join(out_dir, "schema.json")
+    csv_path = os.path.join(data_home, f"{name}.csv")
+    schema = None
+    if os.path.exists(schema_path):
+        with open(schema_path, encoding="utf-8") as file:
+            schema = json.load(file)
+        # 只有列式存储、没有 CSV 时也可以直接使用
+        stale = os.path.exists(csv_path) and schema.get("source") != _source_signature(csv_path)
+        if schema.get("version") != SCHEMA_VERSION or stale:
+            schema = None
+    if schema is None:
+        schema = convert_csv(_ensure_csv(name, data_home, download), out_dir)
+    return ColumnarTable(out_dir, schema, columns)
+
+
+def load_dataset(name, columns=None, data_home=None, download=True):
+    """与 seaborn.load_dataset 用法相同，返回 DataFrame；columns 可只读取部分列"""
+    return open_dataset(name, columns, data_home, download).to_pandas()
@@ -1,10 +1,16 @@
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
+import os
+import sys
 
-iris=sns.load_dataset('iris')
-# print(iris)
-iris_10=iris.sample(10)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_data import open_dataset
+
+# 从本地 seaborn-data/ 读取列式存储，不需要联网
+iris=open_dataset('iris')
+# print(iris.to_pandas())
+iris_10=iris.sample(10)  # 只读取抽中的10行
 sns.scatterplot(x='sepal_length',y='sepal_width',data=iris_10)
 plt.show()
 
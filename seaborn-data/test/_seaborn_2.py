@@ -1,9 +1,14 @@
 import matplotlib.pyplot as plt
 import seaborn as sns
+import os
+import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_data import open_dataset
 
-#导数数据集'titanic'
-titanic=sns.load_dataset('titanic')
+
+#导数数据集'titanic'（从本地 seaborn-data/ 读取，不需要联网）
+titanic=open_dataset('titanic')
 
 #查看数据集的随机10行数据，用sample方法
 sam_10=titanic.sample(10)
@@ -1,5 +1,9 @@
-import requests  
 import json  
+import os  
+import sys  
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "docx"))  
+from http_client import get_default_client  
   
 url =  "https://modelslab.com/api/v6/images/text2img"  
   
@@ -30,6 +34,6 @@ headers =  {
 'Content-Type':  'application/json'  
 }  
   
-response = requests.request("POST", url, headers=headers, data=payload)  
+response = get_default_client().post(url, headers=headers, data=payload)  
   
 print(response.text)